@@ -0,0 +1,259 @@
+"""
+PurePNG benchmark suite
+
+Time encoding and decoding on synthetic images and on PngSuite.  Run
+as a module::
+
+    python -m bench_png [options]
+
+Every measurement is reported as one JSON object per line (or as CSV
+with ``--format csv``) with the following fields:
+
+``case``
+  Name of the measured method, e.g. ``write_array`` or ``asRGBA8``.
+``image``
+  Colour type and bit depth of the image, e.g. ``RGBA16`` or ``P4``.
+``interlace``, ``filter``
+  Interlacing and filter type used for encoding.
+``engine``
+  Filter implementation in use (``cython``, ``numpy`` or ``python``).
+``seconds``
+  Best time among repeats.
+``mbps``
+  Throughput in megabytes of raw (unpacked) pixel data per second.
+``peak_kb``
+  Peak Python memory allocation during one run in kilobytes (empty
+  when ``tracemalloc`` is not available).
+
+Compare pure-Python and accelerated filters by running the suite twice,
+with and without ``--pure``.
+"""
+import sys
+import itertools
+import random
+import json
+import timeit
+import argparse
+
+try:
+    from io import BytesIO
+except ImportError:
+    from StringIO import StringIO as BytesIO
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# (name, greyscale, alpha, palette, bitdepths)
+FORMATS = (('L', True, False, False, (1, 2, 4, 8, 16)),
+           ('LA', True, True, False, (8, 16)),
+           ('RGB', False, False, False, (8, 16)),
+           ('RGBA', False, True, False, (8, 16)),
+           ('P', False, False, True, (1, 2, 4, 8)))
+FILTERS = (0, 1, 2, 3, 4, 'sum', 'entropy')
+ENCODE = ('write', 'write_array', 'write_packed')
+DECODE = ('read', 'read_flat', 'asDirect', 'asRGBA8')
+
+
+def engine_name(png):
+    """Name of filter implementation used by `png`"""
+    base = png.png.BaseFilter
+    if base is png.png.iBaseFilter:
+        return 'python'
+    if base is getattr(png.png, 'NumpyBaseFilter', None):
+        return 'numpy'
+    return 'cython'
+
+
+def measure(func, repeat):
+    """Return best time of `func` among `repeat` runs and peak memory"""
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    best = min(timeit.repeat(func, number=1, repeat=repeat))
+    return best, peak
+
+
+class Image(object):
+
+    """Synthetic test image with all the forms of pixel data needed"""
+
+    def __init__(self, png, width, height, fmt, bitdepth):
+        name, greyscale, alpha, palette, _ = fmt
+        self.name = '%s%d' % (name, bitdepth)
+        self.width = width
+        self.height = height
+        self.planes = 1 + (not greyscale) * 2 + alpha
+        self.info = dict(width=width, height=height, bitdepth=bitdepth,
+                         greyscale=greyscale, alpha=alpha)
+        if palette:
+            self.info['palette'] = [(i, 255 - i, i // 2)
+                                    for i in range(2 ** bitdepth)]
+        maxval = 2 ** bitdepth - 1
+        rnd = random.Random(width * height + bitdepth)
+        vpr = width * self.planes
+        # Gradient with a bit of noise, so filters have some work to do
+        self.rows = [png.array('BH'[bitdepth > 8],
+                               [min(maxval, (x * maxval // vpr +
+                                             y * maxval // height) // 2 +
+                                    rnd.randint(0, maxval // 16))
+                                for x in range(vpr)])
+                     for y in range(height)]
+        self.flat = png.array(self.rows[0].typecode,
+                              itertools.chain(*self.rows))
+        if bitdepth < 8:
+            self.packed = [png.png.pack_samples(row, bitdepth)
+                           for row in self.rows]
+        elif bitdepth == 16:
+            self.packed = [png.png.pack_words(row) for row in self.rows]
+        else:
+            self.packed = [bytearray(row) for row in self.rows]
+        self.size = width * height * self.planes * (1 + (bitdepth > 8))
+
+    def encode(self, png, case, interlace, filter_type):
+        """Encode image with `case` method, return PNG bytes"""
+        out = BytesIO()
+        writer = png.Writer(interlace=interlace, filter_type=filter_type,
+                            **self.info)
+        if case == 'write':
+            writer.write(out, self.rows)
+        elif case == 'write_array':
+            writer.write_array(out, self.flat)
+        else:
+            writer.write_packed(out, self.packed)
+        return out.getvalue()
+
+
+def decode(png, data, case):
+    """Decode PNG `data` with `case` method, consuming all rows"""
+    reader = png.Reader(bytes=data)
+    if case == 'read_flat':
+        reader.read_flat()
+        return
+    for _ in getattr(reader, case)()[2]:
+        pass
+
+
+def run(png, args):
+    """Generate results of all selected cases as dicts"""
+    engine = engine_name(png)
+    width, height = args.size
+    interlaces = (False, True)
+    for fmt in FORMATS:
+        for bitdepth in fmt[4]:
+            img = Image(png, width, height, fmt, bitdepth)
+            if args.image and img.name not in args.image:
+                continue
+            for interlace, filter_type in itertools.product(interlaces,
+                                                            args.filter):
+                base = dict(image=img.name, interlace=interlace,
+                            filter=filter_type, engine=engine)
+                for case in args.encode:
+                    if case == 'write_packed' and interlace:
+                        # Packed rows have to be interlaced already
+                        continue
+                    sec, peak = measure(
+                        lambda: img.encode(png, case, interlace,
+                                           filter_type), args.repeat)
+                    yield dict(base, case=case, seconds=sec,
+                               mbps=img.size / sec / 2 ** 20, peak_kb=peak)
+                data = img.encode(png, 'write_array', interlace, filter_type)
+                for case in args.decode:
+                    sec, peak = measure(lambda: decode(png, data, case),
+                                        args.repeat)
+                    yield dict(base, case=case, seconds=sec,
+                               mbps=img.size / sec / 2 ** 20, peak_kb=peak)
+    if args.pngsuite:
+        import pngsuite
+        files = {}
+        for name, fileobj in pngsuite.png.items():
+            fileobj.seek(0)
+            # Skip broken files which are in PngSuite for error tests
+            if name.startswith('x'):
+                continue
+            files[name] = fileobj.read()
+        for case in args.decode:
+            def decode_all():
+                """Decode the whole suite, return size of pixel data"""
+                size = 0
+                for data in files.values():
+                    reader = png.Reader(bytes=data)
+                    try:
+                        if case == 'read_flat':
+                            size += len(reader.read_flat()[2])
+                        else:
+                            for row in getattr(reader, case)()[2]:
+                                size += len(row)
+                    except png.Error:
+                        pass
+                return size
+            size = decode_all()
+            sec, peak = measure(decode_all, args.repeat)
+            yield dict(case=case, image='pngsuite', interlace=None,
+                       filter=None, engine=engine, seconds=sec,
+                       mbps=size / sec / 2 ** 20, peak_kb=peak)
+
+
+FIELDS = ('case', 'image', 'interlace', 'filter', 'engine',
+          'seconds', 'mbps', 'peak_kb')
+
+
+def main(argv=None):
+    """Run benchmarks, print results to stdout"""
+    def size(text):
+        return tuple(int(it) for it in text.split('x'))
+
+    def filter_type(text):
+        return int(text) if text.isdigit() else text
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1],
+                                     prog='bench_png')
+    parser.add_argument('--size', type=size, default=(256, 256),
+                        help='synthetic image size as WxH (256x256)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='repeat each case and take the best time')
+    parser.add_argument('--image', action='append',
+                        help='limit to image kind, e.g. RGB8 (repeatable)')
+    parser.add_argument('--filter', action='append', type=filter_type,
+                        help='filter types to encode with, default all')
+    parser.add_argument('--encode', action='append', choices=ENCODE,
+                        help='encoding methods, default all')
+    parser.add_argument('--decode', action='append', choices=DECODE,
+                        help='decoding methods, default all')
+    parser.add_argument('--pngsuite', action='store_true',
+                        help='also decode all of PngSuite')
+    parser.add_argument('--pure', action='store_true',
+                        help='do not use Cython or NumPy filters')
+    parser.add_argument('--format', choices=('json', 'csv'),
+                        default='json', help='output format')
+    args = parser.parse_args(argv)
+    args.filter = args.filter or FILTERS
+    args.encode = args.encode or ENCODE
+    args.decode = args.decode or DECODE
+
+    if args.pure:
+        if 'png' in sys.modules:
+            parser.error('--pure must be used before png is imported')
+        sys.modules['png.pngfilters'] = None
+        sys.modules['pngfilters'] = None
+        sys.modules['numpy'] = None
+    import png
+
+    out = sys.stdout
+    if args.format == 'csv':
+        out.write(','.join(FIELDS) + '\n')
+    for result in run(png, args):
+        if args.format == 'csv':
+            out.write(','.join('' if result[it] is None else str(result[it])
+                               for it in FIELDS) + '\n')
+        else:
+            out.write(json.dumps(result, sort_keys=True) + '\n')
+        out.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -145,7 +145,10 @@ import math
 # http://www.python.org/doc/2.4.4/lib/module-operator.html
 import operator
 import datetime
+import functools
 import time
+import io
+import os
 import struct
 import sys
 import zlib
@@ -153,20 +156,32 @@ import zlib
 import warnings
 
 try:
-    from functools import reduce
+    from itertools import imap as map
 except ImportError:
-    # suppose to get there on python<2.7 where reduce is only built-in function
+    # On Python 3 there is no imap, but map works like imap instead
     pass
 
 try:
-    from itertools import imap as map
+    from concurrent.futures import ThreadPoolExecutor
 except ImportError:
-    # On Python 3 there is no imap, but map works like imap instead
-    pass
+    # No thread pool, parallel compression will be done serially
+    ThreadPoolExecutor = None
+
+try:
+    import mmap
+except ImportError:
+    # No memory mapping, files are read as usual
+    mmap = None
+
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional and used only for acceleration
+    numpy = None
 
 __version__ = "0.3.0"
 __all__ = ['png_signature', 'Image', 'Reader', 'Writer',
-           'Error', 'FormatError', 'ChunkError',
+           'Error', 'FormatError', 'ChunkError', 'LimitError',
            'Filter', 'register_extra_filter',
            'write_chunks', 'from_array', 'parse_mode', 'MergedPlanes',
            'PERCEPTUAL', 'RELATIVE_COLORIMETRIC', 'SATURATION',
@@ -242,6 +257,17 @@ def newHarray(length=0):
     return array('H', [0]) * length
 
 
+if hasattr(array, 'frombytes'):
+    array_frombytes = array.frombytes
+    array_tobytes = array.tobytes
+else:
+    # Python 2 names
+    def array_frombytes(arr, src):
+        """Append items from bytes-like `src` to `arr`"""
+        arr.fromstring(bytearray_to_bytes(src))
+    array_tobytes = array.tostring
+
+
 # bytearray is faster than array('B'), so we prefer to use it
 # where available.
 try:
@@ -291,6 +317,14 @@ except ImportError:
         return tuple(map(gen, deques))
 
 
+# memoryview with integer items (Python 3) used for zero-copy rows
+try:
+    if not isinstance(memoryview(bytearray(1))[0], int):
+        raise TypeError
+    bufview = memoryview
+except (NameError, TypeError):
+    bufview = None
+
 # Python 3 workaround
 try:
     basestring
@@ -326,8 +360,8 @@ def peekiter(iterable):
     def gen():
         """Generator that returns first and proxy other items from source"""
         yield one
-        while True:
-            yield next(it)
+        for item in it:
+            yield item
     return (one, gen())
 
 
@@ -440,6 +474,168 @@ def check_time(value):
     raise ValueError("Unsupported time representation:" + repr(value))
 
 
+def adler32_combine(adler1, adler2, len2):
+    """
+    Combine Adler-32 checksums of two sequences into checksum of whole
+
+    `adler1` and `adler2` are checksums of first and second sequence,
+    `len2` is length of second sequence.  Port of zlib function.
+    """
+    base = 65521
+    rem = len2 % base
+    sum1 = adler1 & 0xffff
+    sum2 = (rem * sum1) % base
+    sum1 += (adler2 & 0xffff) + base - 1
+    sum2 += ((adler1 >> 16) & 0xffff) + ((adler2 >> 16) & 0xffff) + base - rem
+    if sum1 >= base:
+        sum1 -= base
+    if sum1 >= base:
+        sum1 -= base
+    if sum2 >= (base << 1):
+        sum2 -= (base << 1)
+    if sum2 >= base:
+        sum2 -= base
+    return sum1 | (sum2 << 16)
+
+
+def compress_segment(data, level=-1, dictionary=None, final=False):
+    """
+    Compress `data` as a part of parallel zlib stream
+
+    Raw deflate data ending at byte boundary is returned
+    with Adler-32 checksum and length of `data` as a tuple.
+    `dictionary` is the tail of previous data (up to 32 KiB) which is
+    used as preset dictionary when supported (Python 3.3+).
+    Last segment of stream should be compressed with `final` set.
+    """
+    compressor = None
+    if dictionary:
+        try:
+            compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                          -zlib.MAX_WBITS, zdict=dictionary)
+        except TypeError:
+            pass
+    if compressor is None:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    if final:
+        flush_mode = zlib.Z_FINISH
+    else:
+        # Empty stored block is added to align on byte
+        flush_mode = zlib.Z_SYNC_FLUSH
+    compressed = compressor.compress(data) + compressor.flush(flush_mode)
+    return compressed, zlib.adler32(data) & 0xffffffff, len(data)
+
+
+# Tables to unpack bytes into samples, built on demand
+_unpack_tables = {}
+
+
+def unpack_samples(raw, bitdepth, width):
+    """
+    Unpack rows of samples with `bitdepth` less than 8 into bytearray
+
+    `raw` is bytes of one or several rows, each row has `width` samples
+    and is padded to whole bytes.  Each byte is unpacked with a
+    lookup table, padding is trimmed once per row.
+    """
+    # Samples per byte
+    spb = 8 // bitdepth
+    if bitdepth not in _unpack_tables:
+        mask = 2 ** bitdepth - 1
+        #                                      reversed range(spb)
+        shifts = [bitdepth * it for it in range(spb - 1, -1, -1)]
+        table = [bytearray_to_bytes(bytearray([mask & (o >> i)
+                                               for i in shifts]))
+                 for o in range(256)]
+        if numpy is None:
+            ntable = None
+        else:
+            ntable = numpy.frombuffer(bytes().join(table), numpy.uint8)
+            ntable = ntable.reshape(256, spb)
+        _unpack_tables[bitdepth] = (table, ntable)
+    table, ntable = _unpack_tables[bitdepth]
+    # Bytes per row
+    bpr = (width + spb - 1) // spb
+    if ntable is not None and len(raw) % bpr == 0:
+        out = ntable[numpy.frombuffer(raw, numpy.uint8)]
+        out = out.reshape(-1, bpr * spb)[:, :width]
+        return bytearray(out.tobytes())
+    out = bytearray(bytes().join(map(table.__getitem__, raw)))
+    if len(raw) <= bpr:
+        del out[width:]
+        return out
+    res = bytearray()
+    for start in range(0, len(out), bpr * spb):
+        res.extend(out[start:start + width])
+    return res
+
+
+def unpack_words(raw):
+    """
+    Convert bytes of big-endian 16-bit samples into array('H')
+
+    Whole row is converted at once, without Python object per sample.
+    """
+    res = array('H')
+    array_frombytes(res, raw)
+    if sys.byteorder == 'little':
+        res.byteswap()
+    return res
+
+
+def pack_words(samples):
+    """Convert sequence of 16-bit samples into bytearray (big-endian)"""
+    if numpy is not None and isinstance(samples, numpy.ndarray):
+        return bytearray(samples.astype('>u2').tobytes())
+    if not isinstance(samples, array) or samples.typecode != 'H' or\
+       sys.byteorder == 'little':
+        samples = array('H', samples)
+    if sys.byteorder == 'little':
+        samples.byteswap()
+    return bytearray(array_tobytes(samples))
+
+
+_pack_tables = {}
+
+
+def pack_samples(samples, bitdepth):
+    """
+    Pack one row of samples with `bitdepth` less than 8 into bytearray
+
+    The row is padded with zero samples to whole bytes.  Each group of
+    samples for one byte is packed with a lookup table (or with NumPy
+    shifts when it is available).
+    """
+    # Samples per byte
+    spb = 8 // bitdepth
+    a = bytearray(samples)
+    extra = -len(a) % spb
+    if extra:
+        a.extend(bytearray(extra))
+    if numpy is not None:
+        arr = numpy.frombuffer(bytearray_to_bytes(a), numpy.uint8)
+        arr = arr.reshape(-1, spb)
+        if bitdepth == 1:
+            out = numpy.packbits(arr, axis=1)
+        else:
+            shifts = numpy.arange(8 - bitdepth, -1, -bitdepth,
+                                  dtype=numpy.uint8)
+            out = numpy.bitwise_or.reduce(arr << shifts, axis=1)
+        return bytearray(out.astype(numpy.uint8).tobytes())
+    if bitdepth not in _pack_tables:
+        table = {}
+        mask = 2 ** bitdepth - 1
+        for o in range(256):
+            #                                      reversed range(spb)
+            key = tuple([mask & (o >> (bitdepth * it))
+                         for it in range(spb - 1, -1, -1)])
+            table[key] = o
+        _pack_tables[bitdepth] = table
+    table = _pack_tables[bitdepth]
+    return bytearray(map(table.__getitem__,
+                         zip(*[a[it::spb] for it in range(spb)])))
+
+
 def popdict(src, keys):
     """
     Extract all keys (with values) from `src` dictionary as new dictionary
@@ -500,6 +696,16 @@ class ChunkError(FormatError):
     """Error in chunk handling"""
 
 
+class LimitError(Error):
+
+    """
+    Image exceeds limits specified for :class:`Reader`.
+
+    This is not a format error, but protection from "bombs": small
+    files which require a lot of memory or time to decode.
+    """
+
+
 class BaseFilter(object):
 
     """
@@ -628,17 +834,14 @@ class BaseFilter(object):
             result[i] = (x - pr) & 0xff
             ai += 1
 
-    def undo_filter(self, filter_type, line):
+    def _unfilter_scanline(self, filter_type, line):
         """
-        Undo the filter for a scanline.
+        Undo the filter for a scanline without updating `prev`.
 
-        `scanline` is a sequence of bytes that does not include
-        the initial filter type byte.
-
-        The scanline will have the effects of filtering removed.
-        Scanline modified inplace and also returned as result.
+        `filter_type` specifies the filter type (0 to 4)
+        `line` specifies the current (filtered) scanline as a sequence
+        of bytes, it will be modified inplace.
         """
-        assert 0 <= filter_type <= 4
         # For the first line of a pass, synthesize a dummy previous line.
         if self.prev is None:
             self.prev = newBarray(len(line))
@@ -659,11 +862,52 @@ class BaseFilter(object):
         elif filter_type == 4:
             self.__undo_filter_paeth(line)
 
+    def undo_filter(self, filter_type, line):
+        """
+        Undo the filter for a scanline.
+
+        `scanline` is a sequence of bytes that does not include
+        the initial filter type byte.
+
+        The scanline will have the effects of filtering removed.
+        Scanline modified inplace and also returned as result.
+        """
+        assert 0 <= filter_type <= 4
+        self._unfilter_scanline(filter_type, line)
         # This will not work writing cython attributes from python
         # Only 'cython from cython' or 'python from python'
         self.prev[:] = line[:]
         return line
 
+    def undo_filter_block(self, block, row_bytes, length=None):
+        """
+        Undo the filters for several consecutive scanlines inplace.
+
+        `block` is a bytearray with scanlines of `row_bytes` length,
+        each one preceded by its filter type byte.  Only first `length`
+        bytes of `block` are processed when `length` is specified.
+        Filter types should be checked by caller.  Filter type bytes
+        are left untouched, last scanline of `block` becomes `prev`.
+        """
+        rb_1 = row_bytes + 1
+        if length is None:
+            length = len(block)
+        try:
+            # Rows are copied through view without temporary slices
+            view = memoryview(block)
+        except NameError:
+            view = block
+        # Two row buffers are reused: one is unfiltered, other one
+        # holds previous row
+        line = bytearray(row_bytes)
+        spare = bytearray(row_bytes)
+        for offset in range(0, length, rb_1):
+            line[:] = view[offset + 1:offset + rb_1]
+            self._unfilter_scanline(block[offset], line)
+            view[offset + 1:offset + rb_1] = line
+            self.prev = line
+            line, spare = spare, line
+
     def _filter_scanline(self, filter_type, line, result):
         """
         Apply a scanline filter to a scanline.
@@ -739,6 +983,131 @@ except:
     BaseFilter = iBaseFilter
 
 
+class NumpyBaseFilter(iBaseFilter):
+
+    """
+    Filtering with NumPy vectorized operations
+
+    Used as :class:`BaseFilter` when compiled filters are unavailable
+    but NumPy is.  Scanlines are processed as a whole and runs of "up"
+    scanlines are undone together.  Undoing "average" and "paeth"
+    is left to pure python part as each byte of them depends on
+    previous result byte.
+    """
+
+    def _unfilter_scanline(self, filter_type, line):
+        """Undo the filter for a scanline without updating `prev`."""
+        if self.prev is None:
+            self.prev = newBarray(len(line))
+            if filter_type == 2:  # "up"
+                filter_type = 0
+            elif filter_type == 4:  # "paeth"
+                filter_type = 1
+
+        if filter_type == 1:
+            cur = numpy.frombuffer(line, numpy.uint8)
+            for i in range(self.fu):
+                plane = cur[i::self.fu]
+                numpy.add.accumulate(plane, dtype=numpy.uint8, out=plane)
+        elif filter_type == 2:
+            cur = numpy.frombuffer(line, numpy.uint8)
+            cur += numpy.frombuffer(self.prev, numpy.uint8)
+        elif filter_type > 2:
+            iBaseFilter._unfilter_scanline(self, filter_type, line)
+
+    def undo_filter_block(self, block, row_bytes, length=None):
+        """Undo the filters for several consecutive scanlines inplace."""
+        rb_1 = row_bytes + 1
+        if length is None:
+            length = len(block)
+        rows = numpy.frombuffer(block, numpy.uint8, length).reshape(-1, rb_1)
+        filter_types = rows[:, 0].tolist()
+        prev = self.prev
+        if prev is not None:
+            prev = numpy.frombuffer(prev, numpy.uint8)
+        i = 0
+        while i < len(filter_types):
+            filter_type = filter_types[i]
+            if prev is None:
+                if filter_type == 2:  # "up"
+                    filter_type = 0
+                elif filter_type == 4:  # "paeth"
+                    filter_type = 1
+            if filter_type == 2:
+                j = i + 1
+                while j < len(filter_types) and filter_types[j] == 2:
+                    j += 1
+                # Each row of "up" run is sum of all rows up to this
+                run = rows[i:j, 1:]
+                numpy.add.accumulate(run, 0, numpy.uint8, run)
+                run += prev
+                i = j
+            elif filter_type == 1:
+                self._unfilter_scanline(1, rows[i, 1:])
+                i += 1
+            elif filter_type > 2:
+                # Pure python part works better with bytearray
+                line = bytearray(rows[i, 1:])
+                if prev is None:
+                    self.prev = None
+                else:
+                    self.prev = bytearray(prev)
+                self._unfilter_scanline(filter_type, line)
+                rows[i, 1:] = numpy.frombuffer(line, numpy.uint8)
+                i += 1
+            else:
+                i += 1
+            prev = rows[i - 1, 1:]
+        if prev is not None:
+            # Do not keep reference to `block`
+            self.prev = bytearray(prev)
+
+    def _filter_scanline(self, filter_type, line, result):
+        """Apply a scanline filter to a scanline."""
+        assert 0 <= filter_type < 5
+        if self.prev is None:
+            if filter_type == 2:  # "up"
+                filter_type = 0
+            elif filter_type == 3:
+                self.prev = newBarray(len(line))
+            elif filter_type == 4:  # "paeth"
+                filter_type = 1
+        if filter_type == 0:
+            return
+
+        fu = self.fu
+        cur = numpy.frombuffer(line, numpy.uint8)
+        res = numpy.frombuffer(result, numpy.uint8)
+        if filter_type == 1:
+            res[fu:] = cur[fu:] - cur[:-fu]
+            return
+        prev = numpy.frombuffer(self.prev, numpy.uint8)
+        if filter_type == 2:
+            res[:] = cur - prev
+        elif filter_type == 3:
+            a = numpy.zeros(len(cur), numpy.uint16)
+            a[fu:] = cur[:-fu]
+            res[:] = cur - ((a + prev) >> 1).astype(numpy.uint8)
+        else:
+            # http://www.w3.org/TR/PNG/#9Filter-type-4-Paeth
+            a = numpy.zeros(len(cur), numpy.int16)
+            a[fu:] = cur[:-fu]
+            b = prev.astype(numpy.int16)
+            c = numpy.zeros(len(cur), numpy.int16)
+            c[fu:] = b[:-fu]
+            pa = numpy.abs(b - c)
+            pb = numpy.abs(a - c)
+            pc = numpy.abs(a + b - c - c)
+            pr = numpy.where((pa <= pb) & (pa <= pc), a,
+                             numpy.where(pb <= pc, b, c))
+            res[:] = (cur - pr).astype(numpy.uint8)
+
+
+if BaseFilter is iBaseFilter and numpy is not None:
+    # No compiled filters, but NumPy could do the job
+    BaseFilter = NumpyBaseFilter
+
+
 class Writer(object):
 
     """PNG encoder in pure Python."""
@@ -799,6 +1168,12 @@ class Writer(object):
             filter_type
                 Enable and specify PNG filter
                 see :meth:`set_filter_type`
+            parallel
+                Compress image data with several threads
+                see :meth:`set_parallel`
+            buffer_size
+                Collect chunks into buffer before writing
+                see :meth:`set_buffer_size`
 
         The image size (in pixels) can be specified either by using the
         `width` and `height` arguments, or with the single `size`
@@ -944,7 +1319,8 @@ class Writer(object):
         popdict(kwargs, ('planes', 'colormap', 'maxval'))
 
         for ex_kw in ('filter_type', 'text', 'resolution', 'modification_time',
-                      'rendering_intent', 'white_point', 'rgb_points'):
+                      'rendering_intent', 'white_point', 'rgb_points',
+                      'parallel', 'buffer_size'):
             getattr(self, 'set_' + ex_kw)(kwargs.pop(ex_kw, None))
         # Keyword text support
         kw_text = popdict(kwargs, _registered_kw)
@@ -1051,6 +1427,38 @@ class Writer(object):
                 filter_type = filter_names[str_ftype]
         self.filter_type = filter_type
 
+    def set_parallel(self, parallel=None, segment_size=2 ** 17):
+        """
+        Set(modify) parallel compression mode
+
+        `parallel` is number of threads used to compress image data
+        or ``True`` to use a thread per CPU.  In parallel mode image data
+        are split into segments of `segment_size` bytes which are
+        compressed independently (with tail of previous segment as
+        preset dictionary) and joined into single zlib stream.
+        This gives a bit worse compression, but much faster on
+        multicore systems.
+        """
+        if parallel is True:
+            try:
+                from multiprocessing import cpu_count
+                parallel = cpu_count()
+            except (ImportError, NotImplementedError):
+                parallel = 1
+        self.parallel = parallel
+        self.segment_size = segment_size
+
+    def set_buffer_size(self, buffer_size=None):
+        """
+        Set(modify) size of output buffer
+
+        With `buffer_size` chunks are collected into buffer of this size
+        and the output file gets few big writes, which is better for
+        unbuffered files, sockets and pipes.  ``None`` or 0 means each
+        chunk is written at once (with single write).
+        """
+        self.buffer_size = buffer_size
+
     def set_modification_time(self, modification_time=True):
         """
         Add time to be written as last modification time
@@ -1242,11 +1650,13 @@ class Writer(object):
         .. note ::
 
           Interlacing will require the entire image to be in working
-          memory.
+          memory.  NumPy array given as `rows` is used as is.
         """
         if self.interlace:
+            if numpy is not None and isinstance(rows, numpy.ndarray):
+                return self.write_array(outfile, rows)
             fmt = 'BH'[self.bitdepth > 8]
-            a = array(fmt, itertools.chain(*rows))
+            a = array(fmt, itertools.chain.from_iterable(rows))
             return self.write_array(outfile, a)
         else:
             nrows = self.write_passes(outfile, rows)
@@ -1320,7 +1730,11 @@ class Writer(object):
 
                 rows = scalerow(rows)
 
-        self.write_idat(outfile, self.comp_idat(self.idat(rows, packed)))
+        if self.parallel:
+            comp_idat = self.comp_idat_parallel
+        else:
+            comp_idat = self.comp_idat
+        self.write_idat(outfile, comp_idat(self.idat(rows, packed)))
         return self.irows
 
     def write_idat(self, outfile, idat_sequence):
@@ -1330,6 +1744,11 @@ class Writer(object):
         `idat_sequence` should be iterable that produce IDAT chunks
         compatible with `Writer` configuration.
         """
+        if self.buffer_size and not isinstance(outfile, BufferedOutput):
+            buffered = BufferedOutput(outfile, self.buffer_size)
+            self.write_idat(buffered, idat_sequence)
+            buffered.flush()
+            return
         # http://www.w3.org/TR/PNG/#5PNG-file-signature
         outfile.write(png_signature)
         color_type = 4 * self.alpha + 2 * (not self.greyscale) +\
@@ -1410,16 +1829,99 @@ class Writer(object):
         if len(flushed):
             yield flushed
 
+    def comp_idat_parallel(self, idat):
+        """
+        Generator that produce compressed IDAT chunks from IDAT data
+
+        Data segments are compressed concurrently (see :meth:`set_parallel`)
+        """
+        # http://www.w3.org/TR/PNG/#11IDAT
+        if self.compression is not None:
+            level = self.compression
+        else:
+            level = -1
+        # zlib header for this compression level, it goes with
+        # the first compressed segment
+        header = zlib.compress(bytes(), level)[:2]
+        size = self.segment_size
+        if ThreadPoolExecutor is None:
+            executor = None
+        else:
+            executor = ThreadPoolExecutor(self.parallel)
+        pending = []
+        adler = 1  # Adler-32 of empty data
+
+        def submit(segment, dictionary, final=False):
+            """Schedule compression of next segment"""
+            if executor is None:
+                pending.append(compress_segment(segment, level,
+                                                dictionary, final))
+            else:
+                pending.append(executor.submit(compress_segment, segment,
+                                               level, dictionary, final))
+
+        def collect():
+            """Wait for oldest segment to be compressed"""
+            res = pending.pop(0)
+            if executor is not None:
+                res = res.result()
+            return res
+
+        try:
+            data = bytearray()
+            dictionary = None
+            for dat in idat:
+                data.extend(dat)
+                whole = len(data) - len(data) % size
+                for start in range(0, whole, size):
+                    segment = bytes(data[start:start + size])
+                    submit(segment, dictionary)
+                    dictionary = segment[-2 ** 15:]
+                del data[:whole]
+                # Limit memory for compressed, but not yet written data
+                while len(pending) > 2 * self.parallel:
+                    compressed, seg_adler, seg_len = collect()
+                    adler = adler32_combine(adler, seg_adler, seg_len)
+                    if len(compressed):
+                        yield header + compressed
+                        header = bytes()
+            submit(bytes(data), dictionary, True)
+            while pending:
+                compressed, seg_adler, seg_len = collect()
+                adler = adler32_combine(adler, seg_adler, seg_len)
+                if pending:
+                    yield header + compressed
+                    header = bytes()
+            yield header + compressed + struct.pack('!I', adler)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
     def idat(self, rows, packed=False):
         """Generator that produce uncompressed IDAT data from rows"""
         # http://www.w3.org/TR/PNG/#11IDAT
         filt = Filter(self.bitdepth * self.planes,
-                      self.interlace, self.height)
+                      self.interlace, self.height, width=self.width)
         data = bytearray()
+        # Adaptive filters are applied to blocks of rows at once
+        block = []
+        block_rows = max(1, 2 ** 16 // (self.width * self.planes))
 
-        def byteextend(rowbytes):
+        def rowextend(rowbytes):
             """Default extending data with bytes. Applying filter"""
-            data.extend(filt.do_filter(self.filter_type, rowbytes))
+            data.extend(filt.do_filter_into(self.filter_type, rowbytes))
+
+        def blockextend(rowbytes):
+            """Extending data with bytes filtered by blocks"""
+            block.append(bytearray(rowbytes))
+            if len(block) >= block_rows:
+                data.extend(filt.do_filter_block(self.filter_type, block))
+                del block[:]
+
+        if isinstance(self.filter_type, int):
+            byteextend = rowextend
+        else:
+            byteextend = blockextend
 
         # Choose an extend function based on the bitdepth.  The extend
         # function packs/decomposes the pixel values into bytes and
@@ -1429,27 +1931,14 @@ class Writer(object):
         elif self.bitdepth == 16:
             def extend(sl):
                 """Decompose into bytes before byteextend"""
-                fmt = '!%dH' % len(sl)
-                byteextend(bytearray(struct.pack(fmt, *sl)))
+                byteextend(pack_words(sl))
         else:
             # Pack into bytes
             assert self.bitdepth < 8
-            # samples per byte
-            spb = 8 // self.bitdepth
 
             def extend(sl):
                 """Pack into bytes before byteextend"""
-                a = bytearray(sl)
-                # Adding padding bytes so we can group into a whole
-                # number of spb-tuples.
-                l = float(len(a))
-                extra = math.ceil(l / float(spb)) * spb - l
-                a.extend([0] * int(extra))
-                # Pack into bytes
-                l = group(a, spb)
-                l = [reduce(lambda x, y: (x << self.bitdepth) + y, e)
-                     for e in l]
-                byteextend(l)
+                byteextend(pack_samples(sl, self.bitdepth))
 
         # Build the first row, testing mostly to see if we need to
         # changed the extend function to cope with NumPy integer types
@@ -1486,6 +1975,8 @@ class Writer(object):
                 # we use ``del`` to empty this one, rather than create a
                 # fresh one (which would be my natural FP instinct).
                 del data[:]
+        if block:
+            data.extend(filt.do_filter_block(self.filter_type, block))
         if len(data):
             yield bytearray_to_bytes(data)
         self.irows = i + 1
@@ -1496,7 +1987,11 @@ class Writer(object):
         the output file.  See also :meth:`write` method.
         """
 
-        if self.interlace:
+        rows = self.buffer_scanlines(pixels)
+        if rows is not None:
+            # Rows are taken from the source buffer, already packed
+            self.write_passes(outfile, rows, packed=True)
+        elif self.interlace:
             self.write_passes(outfile, self.array_scanlines_interlace(pixels))
         else:
             self.write_passes(outfile, self.array_scanlines(pixels))
@@ -1528,17 +2023,99 @@ class Writer(object):
             stop = start + vpr
             yield pixels[start:stop]
 
+    def buffer_scanlines(self, pixels):
+        """
+        Generates packed rows as memoryview slices of a contiguous buffer.
+
+        `pixels` is the full source image in flat row flat pixel format.
+        For interlaced image (NumPy is required) rows of passes are
+        taken from strided view of the buffer, each one is copied once
+        into contiguous array.
+        NumPy integer arrays are accepted for bitdepth 8 and 16 (converted
+        to big-endian bytes at once if needed), `bytes`, `bytearray`,
+        byte `memoryview` and ``array('B')`` for bitdepth 8.
+        Returns ``None`` when `pixels` is not such a buffer or when
+        the image requires per-sample processing (rescaling,
+        ``greyscale='try'``), then :meth:`array_scanlines` should be used.
+        """
+        if bufview is None or self.bitdepth not in (8, 16) or\
+                self.greyscale == 'try':
+            return None
+        if numpy is not None and isinstance(pixels, numpy.ndarray):
+            if pixels.dtype.kind not in 'uib':
+                return None
+            dtype = numpy.dtype(('uint8', '>u2')[self.bitdepth > 8])
+            if pixels.size and pixels.dtype.kind != 'b' and\
+                    (pixels.dtype.kind == 'i' or
+                     pixels.dtype.itemsize > dtype.itemsize):
+                # Conversion would wrap values silently
+                if pixels.min() < 0 or pixels.max() >= 2 ** self.bitdepth:
+                    raise ValueError("pixel values out of range for "
+                                     "bitdepth %d" % self.bitdepth)
+            pixels = numpy.ascontiguousarray(pixels, dtype=dtype)
+            data = bufview(pixels.reshape(-1)).cast('B')
+        elif self.bitdepth != 8:
+            return None
+        elif isinstance(pixels, (bytes, bytearray)):
+            data = bufview(pixels)
+        elif isinstance(pixels, bufview) and pixels.c_contiguous and\
+                pixels.format in ('B', 'c'):
+            data = pixels.cast('B')
+        elif isinstance(pixels, array) and pixels.typecode == 'B':
+            data = bufview(pixels)
+        else:
+            return None
+        row_bytes = self.width * self.planes * (self.bitdepth // 8)
+        if len(data) != row_bytes * self.height:
+            return None
+        if not self.interlace:
+            return (data[start:start + row_bytes]
+                    for start in range(0, len(data), row_bytes))
+        if numpy is None:
+            return None
+        # Last axis is bytes of pixel, so passes are selected the same
+        # way for any bitdepth
+        image = numpy.frombuffer(data, numpy.uint8).reshape(
+            self.height, self.width, -1)
+
+        def passes():
+            for xstart, ystart, xstep, ystep in _adam7:
+                for row in image[ystart::ystep, xstart::xstep]:
+                    if row.size:
+                        yield bufview(numpy.ascontiguousarray(row).reshape(-1))
+        return passes()
+
     def array_scanlines_interlace(self, pixels):
         """
         Generator for interlaced scanlines from an array.
 
-        `pixels` is the full source image in flat row flat pixel format.
+        `pixels` is the full source image in flat row flat pixel format,
+        it may be any buffer or NumPy array.
         The generator yields each scanline of the reduced passes in turn, in
         boxed row flat pixel format.
         """
         # http://www.w3.org/TR/PNG/#8InterlaceMethods
         # Array type.
         fmt = 'BH'[self.bitdepth > 8]
+        if numpy is not None:
+            # Pass rows are strided views of the source, no copy of image
+            if isinstance(pixels, (bytes, bytearray)):
+                # asarray would make 0-dimensional string array of bytes
+                pixels = numpy.frombuffer(pixels, numpy.uint8)
+            else:
+                pixels = numpy.asarray(pixels)
+            dtype = ('uint8', 'uint16')[self.bitdepth > 8]
+            if pixels.dtype != dtype:
+                pixels = pixels.astype(dtype)
+            pixels = pixels.reshape(self.height, self.width, self.planes)
+            for xstart, ystart, xstep, ystep in _adam7:
+                for row in pixels[ystart::ystep, xstart::xstep]:
+                    if row.size:
+                        yield row.reshape(-1)
+            return
+        if not isinstance(pixels, array) and\
+           not (fmt == 'B' and isinstance(pixels, bytearray)):
+            pixels = array(fmt, pixels)
         # Value per row
         vpr = self.width * self.planes
         for xstart, ystart, xstep, ystep in _adam7:
@@ -1555,10 +2132,14 @@ class Writer(object):
                     offset = y * vpr
                     yield pixels[offset:end_offset]
                 else:
-                    row = array(fmt)
-                    # There's no easier way to set the length of an array
-                    row.extend(pixels[0:row_len])
                     offset = y * vpr + xstart * self.planes
+                    if self.planes == 1:
+                        yield pixels[offset:end_offset:xstep]
+                        continue
+                    if fmt == 'B':
+                        row = newBarray(row_len)
+                    else:
+                        row = newHarray(row_len)
                     for i in range(self.planes):
                         row[i::self.planes] = \
                             pixels[offset + i:end_offset:self.planes * xstep]
@@ -1566,16 +2147,70 @@ class Writer(object):
 
 
 def write_chunk(outfile, tag, data=bytes()):
-    """Write a PNG chunk to the output file, including length and checksum."""
+    """
+    Write a PNG chunk to the output file, including length and checksum.
+
+    The chunk is written with single write, or with ``os.writev``
+    when `outfile` is a raw (unbuffered) file.
+    """
     # http://www.w3.org/TR/PNG/#5Chunk-layout
-    outfile.write(struct.pack("!I", len(data)))
     tag = strtobytes(tag)
-    outfile.write(tag)
-    outfile.write(data)
     checksum = zlib.crc32(tag)
     checksum = zlib.crc32(data, checksum)
     checksum &= 0xFFFFFFFF
-    outfile.write(struct.pack("!I", checksum))
+    header = struct.pack("!I", len(data)) + tag
+    trailer = struct.pack("!I", checksum)
+    if writev is not None and isinstance(outfile, io.RawIOBase):
+        try:
+            fd = outfile.fileno()
+        except (EnvironmentError, ValueError):
+            fd = None
+        if fd is not None:
+            writeall(fd, [header, data, trailer])
+            return
+    outfile.write(bytes().join((header, bytearray_to_bytes(data), trailer)))
+
+
+writev = getattr(os, 'writev', None)
+
+
+def writeall(fd, buffers):
+    """Write all `buffers` to file descriptor `fd` with ``os.writev``"""
+    written = writev(fd, buffers)
+    for buf in buffers:
+        if written >= len(buf):
+            written -= len(buf)
+            continue
+        # Partial write, rest is written buffer by buffer
+        buf = bufview(buf)[written:] if bufview else buf[written:]
+        written = 0
+        while len(buf):
+            buf = buf[os.write(fd, buf):]
+
+
+class BufferedOutput(object):
+
+    """Output file wrapper which collects small writes"""
+
+    def __init__(self, outfile, size):
+        self.outfile = outfile
+        self.size = size
+        self.buf = bytearray()
+
+    def write(self, data):
+        """Write `data` to buffer, pass big ones directly"""
+        if len(self.buf) + len(data) > self.size:
+            self.flush()
+        if len(data) >= self.size:
+            self.outfile.write(data)
+        else:
+            self.buf.extend(data)
+
+    def flush(self):
+        """Write buffered data to output file"""
+        if self.buf:
+            self.outfile.write(bytearray_to_bytes(self.buf))
+            del self.buf[:]
 
 
 def write_chunks(out, chunks):
@@ -1695,17 +2330,27 @@ def interleave_planes(ipixels, apixels, ipsize, apsize):
 
 
 class Filter(BaseFilter):
-    def __init__(self, bitdepth=8, interlace=None, rows=None, prev=None):
+    def __init__(self, bitdepth=8, interlace=None, rows=None, prev=None,
+                 width=None):
         BaseFilter.__init__(self, bitdepth)
         if prev is None:
             self.prev = None
         else:
             self.prev = bytearray(prev)
+        # Buffers reused by do_filter_into
+        self._prev_line = None
+        self._spare = None
+        self._out = None
         self.interlace = interlace
         self.restarts = []
         if self.interlace:
-            for _, off, _, step in _adam7:
-                self.restarts.append((rows - off - 1 + step) // step)
+            for xstart, off, _, step in _adam7:
+                if width is not None and xstart >= width:
+                    # Pass is empty
+                    continue
+                pass_rows = (rows - off - 1 + step) // step
+                if pass_rows > 0:
+                    self.restarts.append(pass_rows)
 
     def filter_all(self, line):
         """Doing all filters for specified line
@@ -1721,7 +2366,40 @@ class Filter(BaseFilter):
             lines[filter_type] = res
         return lines
 
+    def filter_all_block(self, lines):
+        """
+        Doing all filters for several consecutive lines with NumPy
+
+        `lines` is 2-dimensional array of unfiltered lines.
+        Return array of filtered lines (without filter type byte) with
+        filter type as first axis.
+        """
+        fu = self.fu
+        cur = lines.astype(numpy.int16)
+        # Lines "off the top" are zero, so filters need no special case
+        above = numpy.zeros_like(cur)
+        if self.prev is not None:
+            above[0] = numpy.frombuffer(self.prev, numpy.uint8)
+        above[1:] = cur[:-1]
+        left = numpy.zeros_like(cur)
+        left[:, fu:] = cur[:, :-fu]
+        upleft = numpy.zeros_like(cur)
+        upleft[:, fu:] = above[:, :-fu]
+        res = numpy.empty((5,) + cur.shape, numpy.uint8)
+        res[0] = lines
+        res[1] = cur - left
+        res[2] = cur - above
+        res[3] = cur - ((left + above) >> 1)
+        # http://www.w3.org/TR/PNG/#9Filter-type-4-Paeth
+        pa = numpy.abs(above - upleft)
+        pb = numpy.abs(left - upleft)
+        pc = numpy.abs(left + above - upleft - upleft)
+        res[4] = cur - numpy.where((pa <= pb) & (pa <= pc), left,
+                                   numpy.where(pb <= pc, above, upleft))
+        return res
+
     adapt_methods = {}
+    adapt_block_methods = {}
 
     def adaptive_filter(self, strategy, line):
         """
@@ -1761,7 +2439,9 @@ class Filter(BaseFilter):
         # Recall that filtering algorithms are applied to bytes,
         # not to pixels, regardless of the bit depth or colour type
         # of the image.
-
+        if isinstance(filter_type, int) and bufview is not None:
+            return self.do_filter_into(filter_type, line,
+                                       newBarray(len(line) + 1))
         line = bytearray(line)
         if isinstance(filter_type, int):
             res = bytearray(line)
@@ -1769,16 +2449,112 @@ class Filter(BaseFilter):
             res.insert(0, filter_type)  # Add filter type as the first byte
         else:
             res = self.adaptive_filter(filter_type, line)
+        self._next_line(line)
+        return res
+
+    def do_filter_into(self, filter_type, line, out=None):
+        """
+        Apply filter like :meth:`do_filter`, but reusing buffers.
+
+        Filter type byte and filtered line are written into `out`, which
+        should be bytearray of ``len(line) + 1`` bytes.  By default
+        internal buffer is used, it is overwritten by the next call.
+        Returns the buffer with result.  The line is copied into spare
+        buffer which becomes `prev`, so previous `prev` is reused as
+        spare one and no new rows are allocated.
+        """
+        size = len(line)
+        spare = self._spare
+        if spare is None or len(spare) != size:
+            spare = newBarray(size)
+        try:
+            spare[:] = line
+        except TypeError:
+            # Rows like NumPy arrays are copied as buffers of bytes
+            if bufview is None:
+                spare[:] = bytearray(line)
+            else:
+                view = bufview(line)
+                if view.itemsize != 1:
+                    raise
+                spare[:] = view.cast('B')
+        line = spare
+        if out is None:
+            out = self._out
+            if out is None or len(out) != size + 1:
+                out = self._out = newBarray(size + 1)
+        if isinstance(filter_type, int) and bufview is not None:
+            out[0] = filter_type
+            # Filters expect result initialised with the line
+            out[1:] = line
+            self._filter_scanline(filter_type, line, bufview(out)[1:])
+        elif isinstance(filter_type, int):
+            res = bytearray(line)
+            self._filter_scanline(filter_type, line, res)
+            out[0] = filter_type
+            out[1:] = res
+        else:
+            out[:] = self.adaptive_filter(filter_type, line)
+        self._next_line(line)
+        return out
+
+    def _next_line(self, line):
+        """Make unfiltered `line` previous one, caring about restarts"""
+        # Old previous line is not used any more, keep it as spare
+        self._spare = self._prev_line
+        self._prev_line = line
         self.prev = line
         if self.restarts:
             self.restarts[0] -= 1
             if self.restarts[0] == 0:
                 del self.restarts[0]
                 self.prev = None
+
+    def do_filter_block(self, filter_type, lines):
+        """
+        Applying filter to several consecutive lines
+
+        Return all filtered lines joined into single bytearray.
+        Adaptive strategies registered with block selector
+        (see :meth:`register_extra_filter`) evaluate all filters
+        for all lines at once, otherwise lines are filtered one by one.
+        """
+        selector = None
+        cfg = filter_type
+        if isinstance(cfg, (basestring, bytes)):
+            cfg = {'name': str(cfg)}
+        if numpy is not None and isinstance(cfg, dict):
+            selector = Filter.adapt_block_methods.get(cfg['name'])
+        if selector is None:
+            return bytearray().join([self.do_filter(filter_type, line)
+                                     for line in lines])
+
+        res = bytearray()
+        while lines:
+            # Lines of single interlace pass at once
+            if self.restarts:
+                part = lines[:self.restarts[0]]
+            else:
+                part = lines
+            lines = lines[len(part):]
+            block = numpy.frombuffer(bytearray().join(part), numpy.uint8)
+            block = block.reshape(len(part), -1)
+            candidates = self.filter_all_block(block)
+            chosen = numpy.asarray(selector(candidates, cfg))
+            out = numpy.empty((len(part), block.shape[1] + 1), numpy.uint8)
+            out[:, 0] = chosen
+            out[:, 1:] = candidates[chosen, numpy.arange(len(part))]
+            res.extend(out.tobytes())
+            self.prev = bytearray(part[-1])
+            if self.restarts:
+                self.restarts[0] -= len(part)
+                if self.restarts[0] == 0:
+                    del self.restarts[0]
+                    self.prev = None
         return res
 
 
-def register_extra_filter(selector, name):
+def register_extra_filter(selector, name, block_selector=None):
     """
     Register adaptive filter selection strategy for futher usage.
 
@@ -1791,8 +2567,19 @@ def register_extra_filter(selector, name):
     callable should return chosen line
 
     `name` - name which may be used later to recall this strategy
+
+    `block_selector` - optional callable like ``def(candidates, cfg)``
+    which do same selection for many lines at once with NumPy
+
+    - candidates - array of lines filtered with each filter type,
+      indexed by filter type, line and byte
+    - cfg - dict with optional tuning
+
+    callable should return sequence of chosen filter types
     """
     Filter.adapt_methods[str(name)] = selector
+    if block_selector is not None:
+        Filter.adapt_block_methods[str(name)] = block_selector
 
 
 # Two basic adaptive strategies
@@ -1802,7 +2589,15 @@ def adapt_sum(line, cfg, filter_obj):
     res_s = [sum(it) for it in lines]
     r = res_s.index(min(res_s))
     return lines[r]
-register_extra_filter(adapt_sum, 'sum')
+
+
+def adapt_sum_block(candidates, cfg):
+    """Determine best filters by sum of all row values with NumPy"""
+    # Filter type byte counts too
+    res_s = candidates.sum(axis=2, dtype=numpy.int64)
+    res_s += numpy.arange(5).reshape(5, 1)
+    return res_s.argmin(axis=0)
+register_extra_filter(adapt_sum, 'sum', adapt_sum_block)
 
 
 def adapt_entropy(line, cfg, filter_obj):
@@ -1811,7 +2606,17 @@ def adapt_entropy(line, cfg, filter_obj):
     res_c = [len(set(it)) for it in lines]
     r = res_c.index(min(res_c))
     return lines[r]
-register_extra_filter(adapt_entropy, 'entropy')
+
+
+def adapt_entropy_block(candidates, cfg):
+    """Determine best filters by dispersion of row values with NumPy"""
+    ordered = numpy.sort(candidates, axis=2)
+    res_c = (ordered[:, :, 1:] != ordered[:, :, :-1]).sum(axis=2) + 1
+    # Filter type byte counts when it differs from all values
+    types = numpy.arange(5).reshape(5, 1, 1)
+    res_c += ~(candidates == types).any(axis=2)
+    return res_c.argmin(axis=0)
+register_extra_filter(adapt_entropy, 'entropy', adapt_entropy_block)
 
 
 def parse_mode(mode, default_bitdepth=None):
@@ -1860,13 +2665,6 @@ def from_array(a, mode=None, info=None):
     One application of this function is easy PIL-style saving:
     ``png.from_array(pixels, 'L').save('foo.png')``.
 
-    .. note :
-
-      The use of the term *3-dimensional* is for marketing purposes
-      only.  It doesn't actually work.  Please bear with us.  Meanwhile
-      enjoy the complimentary snacks (on request) and please use a
-      2-dimensional array.
-
     Unless they are specified using the *info* parameter, the PNG's
     height and width are taken from the array size.  For a 3 dimensional
     array the first axis is the height; the second axis is the width;
@@ -1889,6 +2687,9 @@ def from_array(a, mode=None, info=None):
     ``'RGBA'``
       colour image with alpha (4 channel)
 
+    *mode* may be omitted for a 3-dimensional ``numpy`` array, then it
+    is derived from the size of the last axis.
+
     The mode string can also specify the bit depth (overriding how this
     function normally derives the bit depth, see below).  Appending
     ``';16'`` to the mode will cause the PNG to be 16 bits per channel;
@@ -1907,6 +2708,9 @@ def from_array(a, mode=None, info=None):
     2-dimensional array is assumed.  It's slightly more complicated than
     that because an iterator of rows can be used, and it all still
     works.  Using an iterator allows data to be streamed efficiently.
+    A ``numpy`` array (2- or 3-dimensional) is not iterated by rows,
+    its whole buffer is given to the writer at once, see
+    :meth:`Writer.write_array`.
 
     The bit depth of the PNG is normally taken from the array element's
     datatype (but if *mode* specifies a bitdepth then that is used
@@ -1944,6 +2748,13 @@ def from_array(a, mode=None, info=None):
     else:
         info = dict(info)
 
+    if mode is None:
+        # Derive colour format from the last axis of 3-dimensional array
+        shape = getattr(a, 'shape', ())
+        if len(shape) != 3 or not 1 <= shape[2] <= 4:
+            raise Error("mode is required unless a is 3-dimensional array.")
+        mode = ('L', 'LA', 'RGB', 'RGBA')[shape[2] - 1]
+
     # Syntax check mode string.
     grayscale, alpha, bitdepth = parse_mode(mode)
 
@@ -1985,7 +2796,11 @@ def from_array(a, mode=None, info=None):
     # In order to work out whether we the array is 2D or 3D we need its
     # first row, which requires that we take a copy of its iterator.
     # We may also need the first row to derive width and bitdepth.
-    row, a = peekiter(a)
+    if numpy is not None and isinstance(a, numpy.ndarray):
+        # Array is passed to writer as a whole, no need to iterate
+        row = a[0]
+    else:
+        row, a = peekiter(a)
     try:
         row[0][0]
         threed = True
@@ -2000,8 +2815,11 @@ def from_array(a, mode=None, info=None):
             width = len(row) // planes
         info['width'] = width
 
-    # Not implemented yet
-    assert not threed
+    if threed:
+        if len(testelement) != planes:
+            raise Error("third dimension of array should match mode.")
+        if numpy is None or not isinstance(a, numpy.ndarray):
+            a = (list(itertools.chain.from_iterable(row)) for row in a)
 
     if 'bitdepth' not in info:
         try:
@@ -2074,11 +2892,36 @@ class Image(object):
                 file.close()
 
         try:
-            w.write(file, self.rows)
+            if numpy is not None and isinstance(self.rows, numpy.ndarray):
+                w.write_array(file, self.rows.reshape(-1))
+            else:
+                w.write(file, self.rows)
         finally:
             close()
 
 
+def crc_mismatch(chunk_type, data, checksum):
+    """
+    Verify `checksum` of chunk.
+
+    Returns error message when it does not match, otherwise ``None``.
+    """
+    verify = zlib.crc32(strtobytes(chunk_type))
+    verify = zlib.crc32(data, verify)
+    # Whether the output from zlib.crc32 is signed or not varies
+    # according to hideous implementation details, see
+    # http://bugs.python.org/issue1202 .
+    # We coerce it to be positive here (in a way which works on
+    # Python 2.3 and older).
+    verify &= 2**32 - 1
+    verify = struct.pack('!I', verify)
+    if checksum != verify:
+        (a, ) = struct.unpack('!I', checksum)
+        (b, ) = struct.unpack('!I', verify)
+        return "Checksum error in %s chunk: 0x%08X != 0x%08X." %\
+            (chunk_type, a, b)
+
+
 class _readable(object):
 
     """A simple file-like interface for strings and arrays."""
@@ -2091,10 +2934,50 @@ class _readable(object):
         """Read `n` chars from buffer"""
         r = self.buf[self.offset:self.offset + n]
         if isinstance(r, array):
-            r = r.tostring()
+            r = array_tobytes(r)
         self.offset += n
         return r
 
+    def tell(self):
+        """Current position in buffer"""
+        return self.offset
+
+    def seek(self, offset):
+        """Move to `offset` from the beginning of buffer"""
+        self.offset = offset
+
+
+class _mmapped(_readable):
+
+    """File-like interface for memory-mapped file."""
+
+    def __init__(self, fileobj):
+        self.map = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        if bufview is not None:
+            _readable.__init__(self, memoryview(self.map))
+        else:
+            # Slices of mmap are copies, still no read calls
+            _readable.__init__(self, self.map)
+        self.offset = fileobj.tell()
+
+    def read(self, n):
+        """Read `n` bytes as a copy"""
+        return bytes(_readable.read(self, n))
+
+    def view(self, n):
+        """Read `n` bytes as a view of the mapping where possible"""
+        return _readable.read(self, n)
+
+    def close(self):
+        """Unmap the file unless some views are still in use"""
+        try:
+            if self.buf is not self.map:
+                self.buf.release()
+            self.map.close()
+        except BufferError:
+            # Mapping is closed when the last view is released
+            pass
+
 
 class Reader(object):
 
@@ -2114,7 +2997,76 @@ class Reader(object):
           A file-like object (object with a read() method).
         bytes
           ``array`` or ``string`` with PNG data.
+
+        Other keyword arguments are options which tune decoding:
+
+        batched
+          Return rows of straightlaced images as ``memoryview`` of single
+          reused buffer where all complete rows of each decompressed
+          block are unfiltered at once.  Such row is valid only until
+          next block is decoded, so copy rows you want to keep.
+          On Python 2 rows are still copied.
+        block_size
+          Maximal size of decompressed image data blocks, so memory
+          used for decoding does not depend on size of ``IDAT`` chunks.
+          0 means whole chunk at once.  Default is 1 MiB.
+        max_pixels
+          Maximal number of pixels (width * height) in the image.
+        max_decompressed
+          Maximal total size of decompressed data, both image data
+          and compressed ancillary chunks.
+        max_chunks_total
+          Maximal total size of all chunks (including length, type and
+          checksum) which could be read.
+
+        When any of these limits is exceeded :class:`LimitError` is
+        raised.  Image size is checked with ``IHDR`` chunk, before any
+        image data are read; chunk size is checked before the chunk is
+        read; decompressed size is checked for each decompressed block.
+        By default there are no limits.
+
+        crop
+          Region of the image to decode as ``(left, top, right, bottom)``
+          tuple, any of them may be ``None`` for the image edge, so
+          ``(None, start, None, stop)`` is a range of rows.
+          :meth:`read` and methods based on it return only this region.
+          Rows above it are only unfiltered and reading of straightlaced
+          image stops after the last row of the region.
+        crc
+          Policy of chunk checksum verification: ``'all'`` (default)
+          verifies every chunk, ``'critical'`` only critical chunks,
+          ``'none'`` skips verification, ``'background'`` verifies all
+          chunks in a separate thread while decoding goes on, mismatch
+          is reported by :meth:`crc_report`.  It is called when the
+          rows returned by :meth:`read` (and methods based on it),
+          :meth:`read_rows` or :meth:`read_passes` are exhausted, by
+          :meth:`read_array` and :meth:`scan_metadata`.  Callers who
+          stop earlier (e.g. after :meth:`preamble` or by abandoning
+          the rows) should call :meth:`crc_report` themselves.
+        mmap
+          Memory-map file given by `filename` or `file` (which should
+          have ``fileno``) instead of reading it.  ``IDAT`` chunks are then
+          passed to zlib as views of the mapping without copying.
         """
+        self.batched = kw.pop('batched', False)
+        self.block_size = kw.pop('block_size', 2 ** 20)
+        self.max_pixels = kw.pop('max_pixels', None)
+        self.max_decompressed = kw.pop('max_decompressed', None)
+        self.max_chunks_total = kw.pop('max_chunks_total', None)
+        self.crop = kw.pop('crop', None)
+        use_mmap = kw.pop('mmap', False)
+        self.crc = kw.pop('crc', 'all')
+        if self.crc not in ('all', 'critical', 'none', 'background'):
+            raise ValueError("unknown crc policy %r" % (self.crc,))
+        # Results of checksum verification
+        self.crc_checked = 0
+        self.crc_skipped = 0
+        self.crc_errors = []
+        self.crc_pending = []
+        self.crc_pool = None
+        # Amount of data already processed to check limits
+        self.decompressed = 0
+        self.chunks_total = 0
         if ((_guess is not None and len(kw) != 0) or
                 (_guess is None and len(kw) != 1)):
             raise TypeError("Reader() takes exactly 1 argument")
@@ -2128,6 +3080,8 @@ class Reader(object):
         # past the 4 bytes that specify the chunk type).  See preamble
         # method for how this is used.
         self.atchunk = None
+        # Checkpoints made by build_index
+        self.row_index = None
 
         if _guess is not None:
             if isinstance(_guess, array):
@@ -2147,9 +3101,20 @@ class Reader(object):
             self.file = _readable(kw["bytes"])
         else:
             raise TypeError("expecting filename, file or bytes array")
+        if use_mmap and mmap is not None and "bytes" not in kw:
+            try:
+                mapped = _mmapped(self.file)
+            except (ValueError, EnvironmentError):
+                # Empty file or no mapping for this kind of file
+                pass
+            else:
+                if self.close_file:
+                    self.file.close()
+                self.file = mapped
+                self.close_file = True
 
     def __del__(self):
-        if self.close_file:
+        if getattr(self, 'close_file', False):
             self.file.close()
 
     def chunk(self, seek=None, lenient=False):
@@ -2176,7 +3141,11 @@ class Reader(object):
                 self.atchunk = self.chunklentype()
             length, chunk_type = self.atchunk
             self.atchunk = None
-            data = self.file.read(length)
+            if chunk_type == 'IDAT' and isinstance(self.file, _mmapped):
+                # Zero-copy for image data
+                data = self.file.view(length)
+            else:
+                data = self.file.read(length)
             if len(data) != length:
                 raise ChunkError('Chunk %s too short for required %i octets.'
                   % (chunk_type, length))
@@ -2186,26 +3155,158 @@ class Reader(object):
                                  chunk_type)
             if seek and chunk_type != seek:
                 continue
-            verify = zlib.crc32(strtobytes(chunk_type))
-            verify = zlib.crc32(data, verify)
-            # Whether the output from zlib.crc32 is signed or not varies
-            # according to hideous implementation details, see
-            # http://bugs.python.org/issue1202 .
-            # We coerce it to be positive here (in a way which works on
-            # Python 2.3 and older).
-            verify &= 2**32 - 1
-            verify = struct.pack('!I', verify)
-            if checksum != verify:
-                (a, ) = struct.unpack('!I', checksum)
-                (b, ) = struct.unpack('!I', verify)
-                message = "Checksum error in %s chunk: 0x%08X != 0x%08X." %\
-                                        (chunk_type, a, b)
-                if lenient:
-                    warnings.warn(message, RuntimeWarning)
-                else:
-                    raise ChunkError(message)
+            self._check_crc(chunk_type, data, checksum, lenient)
             return chunk_type, data
 
+    def _check_crc(self, chunk_type, data, checksum, lenient=False):
+        """Verify `checksum` of chunk according to `crc` policy."""
+        if self.crc == 'none' or\
+                (self.crc == 'critical' and chunk_type[0].islower()):
+            self.crc_skipped += 1
+            return
+        if self.crc == 'background' and ThreadPoolExecutor is not None:
+            if self.crc_pool is None:
+                self.crc_pool = ThreadPoolExecutor(1)
+            self.crc_pending.append(self.crc_pool.submit(
+                crc_mismatch, chunk_type, data, checksum))
+            return
+        self._crc_result(crc_mismatch(chunk_type, data, checksum), lenient)
+
+    def _crc_result(self, message, lenient=False):
+        """Count result of checksum verification, raise or warn."""
+        self.crc_checked += 1
+        if message is None:
+            return
+        self.crc_errors.append(message)
+        if lenient:
+            warnings.warn(message, RuntimeWarning)
+        else:
+            raise ChunkError(message)
+
+    def crc_report(self, lenient=False):
+        """
+        Finish checksum verification and report results.
+
+        Waits for checksums verified in background, and raises
+        :class:`ChunkError` (or warns when `lenient` is true) about
+        mismatches found there.  Returns dictionary with numbers of
+        ``checked`` and ``skipped`` chunks and list of ``errors``.
+        It is called when ``IEND`` chunk is reached.
+        """
+        pending = self.crc_pending
+        self.crc_pending = []
+        try:
+            for future in pending:
+                self._crc_result(future.result(), lenient)
+        finally:
+            if self.crc_pool is not None:
+                self.crc_pool.shutdown()
+                self.crc_pool = None
+        return dict(checked=self.crc_checked, skipped=self.crc_skipped,
+                    errors=list(self.crc_errors))
+
+    def _crc_finish(self, rows, lenient=False):
+        """
+        Iterate `rows`, then report checksums verified in background.
+
+        If the iteration is abandoned the background thread is stopped
+        and the results are left for :meth:`crc_report`.
+        """
+        if self.crc != 'background':
+            return rows
+
+        def finish():
+            try:
+                for row in rows:
+                    yield row
+                self.crc_report(lenient)
+            finally:
+                if self.crc_pool is not None:
+                    self.crc_pool.shutdown()
+                    self.crc_pool = None
+        return finish()
+
+    def chunk_directory(self):
+        """
+        Scan chunks of seekable input without reading their data.
+
+        Returns list of (*chunk_type*, *offset*, *length*) tuples, where
+        *offset* is the position of chunk data in the input.  Only
+        length and type of each chunk are read, bodies are skipped with
+        ``seek``, checksums are not verified.  Current position of the
+        input is kept, so the reader could be used as usual afterwards.
+        Raises :class:`Error` when input is not seekable.
+        """
+        self.validate_signature()
+        if self.chunks_start is None:
+            raise Error("chunk directory requires seekable input")
+        position = self.file.tell()
+        offset = self.chunks_start
+        directory = []
+        try:
+            while True:
+                self.file.seek(offset)
+                header = self.file.read(8)
+                if len(header) != 8:
+                    break
+                length, chunk_type = struct.unpack('!I4s', header)
+                chunk_type = bytestostr(chunk_type)
+                if length > 2**31-1:
+                    raise FormatError('Chunk %s is too large: %d.' %
+                                      (chunk_type, length))
+                directory.append((chunk_type, offset + 8, length))
+                offset += length + 12
+                if chunk_type == 'IEND':
+                    break
+        finally:
+            self.file.seek(position)
+        return directory
+
+    def chunk_data(self, entry, verify=False, lenient=False):
+        """
+        Read data of the chunk from :meth:`chunk_directory` entry.
+
+        When `verify` is true the checksum is verified, see :meth:`chunk`
+        for `lenient`.
+        """
+        chunk_type, offset, length = entry
+        position = self.file.tell()
+        try:
+            self.file.seek(offset)
+            data = self.file.read(length)
+            checksum = self.file.read(4)
+        finally:
+            self.file.seek(position)
+        if len(data) != length or len(checksum) != 4:
+            raise ChunkError('Chunk %s too short for required %i octets.'
+                             % (chunk_type, length))
+        if verify:
+            self._crc_result(crc_mismatch(chunk_type, data, checksum),
+                             lenient)
+        return data
+
+    def scan_metadata(self, chunk_types=None, verify=False, lenient=False):
+        """
+        Extract metadata without reading image data.
+
+        Chunks from :meth:`chunk_directory` are processed in file order,
+        including those after ``IDAT``.  `chunk_types` limits
+        processed chunks (``IHDR`` is always processed), by default all
+        chunks except ``IDAT`` are.  Returns metadata dictionary like
+        :meth:`read`.
+        """
+        for entry in self.chunk_directory():
+            chunk_type = entry[0]
+            if chunk_type == 'IDAT' or (chunk_types is not None and
+                                        chunk_type != 'IHDR' and
+                                        chunk_type not in chunk_types):
+                continue
+            method = getattr(self, '_process_' + chunk_type, None)
+            if method:
+                method(self.chunk_data(entry, verify, lenient))
+        self.crc_report(lenient)
+        return self._metadata()
+
     def chunks(self):
         """Return an iterator that will yield each chunk as a
         (*chunktype*, *content*) pair.
@@ -2216,10 +3317,69 @@ class Reader(object):
             if t == 'IEND':
                 break
 
+    def iterpasses(self, raw):
+        """
+        Iterator that undoes filtering of interlaced image pass by pass
+
+        `raw` should be bytes of whole image or an iterable that yields
+        the raw bytes in chunks of arbitrary size; chunks are consumed
+        only as far as needed for the current pass.  Yields
+        ``(xstart, ystart, xstep, ystep, ppr, flat)`` for each non-empty
+        Adam7 pass, where `flat` is reduced image of the pass in flat
+        row flat pixel format with `ppr` pixels per row.
+        """
+        filt = Filter(self.bitdepth * self.planes)
+        if isinstance(raw, (bytes, bytearray)):
+            data = raw
+            raw = iter(())
+        else:
+            data = bytearray()
+            raw = iter(raw)
+        source_offset = 0
+        for xstart, ystart, xstep, ystep in _adam7:
+            if xstart >= self.width:
+                continue
+            # The previous (reconstructed) scanline.  None at the
+            # beginning of a pass to indicate that there is no previous
+            # line.
+            filt.prev = None
+            # Pixels per row (reduced pass image)
+            ppr = int(math.ceil((self.width-xstart)/float(xstep)))
+            # Row size in bytes for this pass.
+            row_size = int(math.ceil(self.psize * ppr))
+            rb_1 = row_size + 1
+            ys = range(ystart, self.height, ystep)
+            if not len(ys):
+                continue
+            while len(data) - source_offset < len(ys) * rb_1:
+                chunk = next(raw, None)
+                if chunk is None:
+                    break
+                # Drop data of previous passes
+                del data[:source_offset]
+                data.extend(chunk)
+                source_offset = 0
+            # Whole pass is unfiltered at once
+            block = bytearray(
+                data[source_offset:source_offset + len(ys) * rb_1])
+            source_offset += len(ys) * rb_1
+            if len(block) != len(ys) * rb_1:
+                raise FormatError(
+                  'Wrong size for decompressed IDAT chunk.')
+            if max(block[::rb_1]) > 4:
+                raise FormatError('Invalid PNG Filter Type.'
+                '  See http://www.w3.org/TR/2003/REC-PNG-20031110/#9Filters .')
+            filt.undo_filter_block(block, row_size)
+            # Drop filter type bytes and convert whole pass at once
+            del block[::rb_1]
+            yield xstart, ystart, xstep, ystep, ppr, \
+                self.serialtoflat(block, ppr)
+
     def deinterlace(self, raw):
         """
         Read raw pixel data, undo filters, deinterlace, and flatten.
 
+        `raw` is the same as for :meth:`iterpasses`.
         Return in flat row flat pixel format.
         """
         # Values per row (of the target image)
@@ -2232,40 +3392,41 @@ class Reader(object):
             a = newHarray(vpr * self.height)
         else:
             a = newBarray(vpr * self.height)
-        source_offset = 0
-        filt = Filter(self.bitdepth * self.planes)
-        for xstart, ystart, xstep, ystep in _adam7:
-            if xstart >= self.width:
+        # With NumPy each pass is scattered by single strided assignment
+        target = None
+        if numpy is not None:
+            target = numpy.frombuffer(a, ('uint8', 'uint16')[
+                self.bitdepth > 8])
+            if target.flags.writeable:
+                target = target.reshape(self.height, self.width,
+                                        self.planes)
+            else:
+                target = None
+        for xstart, ystart, xstep, ystep, ppr, flat in self.iterpasses(raw):
+            ys = range(ystart, self.height, ystep)
+            if target is not None:
+                target[ystart::ystep, xstart::xstep] = numpy.frombuffer(
+                    flat, target.dtype).reshape(len(ys), ppr, self.planes)
                 continue
-            # The previous (reconstructed) scanline.  None at the
-            # beginning of a pass to indicate that there is no previous
-            # line.
-            filt.prev = None
-            # Pixels per row (reduced pass image)
-            ppr = int(math.ceil((self.width-xstart)/float(xstep)))
-            # Row size in bytes for this pass.
-            row_size = int(math.ceil(self.psize * ppr))
-            for y in range(ystart, self.height, ystep):
-                filter_type = raw[source_offset]
-                scanline = raw[source_offset + 1:source_offset + row_size + 1]
-                source_offset += (row_size + 1)
-                if filter_type not in (0, 1, 2, 3, 4):
-                    raise FormatError('Invalid PNG Filter Type.'
-                '  See http://www.w3.org/TR/2003/REC-PNG-20031110/#9Filters .')
-                filt.undo_filter(filter_type, scanline)
-                # Convert so that there is one element per pixel value
-                flat = self.serialtoflat(scanline, ppr)
+            if bufview is not None:
+                # Strided slices of views are copied without temporaries
+                dest, src = bufview(a), bufview(flat)
+            else:
+                dest, src = a, flat
+            # Values per row of the pass
+            vpp = ppr * self.planes
+            for n, y in enumerate(ys):
                 end_offset = (y + 1) * vpr
                 if xstep == 1:
                     # Last pass (0, 1, 1, 2))
                     assert xstart == 0
                     offset = y * vpr
-                    a[offset:end_offset] = flat
+                    dest[offset:end_offset] = src[n * vpp:(n + 1) * vpp]
                 else:
                     offset = y * vpr + xstart * self.planes
                     for i in range(self.planes):
-                        a[offset + i:end_offset:self.planes * xstep] = \
-                            flat[i::self.planes]
+                        dest[offset + i:end_offset:self.planes * xstep] = \
+                            src[n * vpp + i:(n + 1) * vpp:self.planes]
         return a
 
     def iterboxed(self, rows):
@@ -2284,19 +3445,9 @@ class Reader(object):
             if self.bitdepth == 8:
                 return raw
             if self.bitdepth == 16:
-                raw = bytearray_to_bytes(raw)
-                return array('H', struct.unpack('!%dH' % (len(raw) // 2), raw))
+                return unpack_words(raw)
             assert self.bitdepth < 8
-            width = self.width
-            # Samples per byte
-            spb = 8 // self.bitdepth
-            out = newBarray()
-            mask = 2 ** self.bitdepth - 1
-            #                                      reversed range(spb)
-            shifts = [self.bitdepth * it for it in range(spb - 1, -1, -1)]
-            for o in raw:
-                out.extend([mask & (o >> i) for i in shifts])
-            return out[:width]
+            return unpack_samples(raw, self.bitdepth, self.width)
 
         return map(asvalues, rows)
 
@@ -2305,59 +3456,64 @@ class Reader(object):
         if self.bitdepth == 8:
             return raw
         if self.bitdepth == 16:
-            raw = bytearray_to_bytes(raw)
-            return array('H',
-              struct.unpack('!%dH' % (len(raw) // 2), raw))
+            return unpack_words(raw)
         assert self.bitdepth < 8
         if width is None:
             width = self.width
-        # Samples per byte
-        spb = 8 // self.bitdepth
-        out = newBarray()
-        mask = 2**self.bitdepth - 1
-        #                                      reversed range(spb)
-        shifts = [self.bitdepth * it for it in range(spb - 1, -1, -1)]
-        l = width
-        for o in raw:
-            out.extend([(mask&(o>>s)) for s in shifts][:l])
-            l -= spb
-            if l <= 0:
-                l = width
-        return out
+        return unpack_samples(raw, self.bitdepth, width)
 
-    def iterstraight(self, raw):
+    def iterstraight(self, raw, prev=None):
         """
         Iterator that undoes the effect of filtering
 
         Yields each row in serialised format (as a sequence of bytes).
         Assumes input is straightlaced.  `raw` should be an iterable
         that yields the raw bytes in chunks of arbitrary size.
+        `prev` is the (unfiltered) row before the first one of `raw`.
+
+        All complete rows of each chunk are unfiltered at once inplace.
+        In `batched` mode rows are yielded as views of this buffer.
         """
         # length of row, in bytes (with filter)
         rb_1 = self.row_bytes + 1
         a = bytearray()
-        filt = Filter(self.bitdepth * self.planes)
+        # length of incomplete row kept at the beginning of `a`
+        rest = 0
+        filt = Filter(self.bitdepth * self.planes, prev=prev)
+        if self.batched and bufview is not None:
+            rowview = bufview
+        else:
+            rowview = None
         for some in raw:
-            a.extend(some)
-            offset = 0
-            while len(a) >= rb_1 + offset:
-                filter_type = a[offset]
-                if filter_type not in (0, 1, 2, 3, 4):
+            end = rest + len(some)
+            if end > len(a):
+                # Rows from old buffer may be still in use, so don't resize
+                new = newBarray(end)
+                new[:rest] = a[:rest]
+                a = new
+            a[rest:end] = some
+            block_end = end - end % rb_1
+            if block_end:
+                if max(a[0:block_end:rb_1]) > 4:
                     raise FormatError('Invalid PNG Filter Type.'
                 '  See http://www.w3.org/TR/2003/REC-PNG-20031110/#9Filters .')
-                scanline = a[offset + 1:offset + rb_1]
-                filt.undo_filter(filter_type, scanline)
-                yield scanline
-                offset += rb_1
-            del a[:offset]
-
-        if len(a) != 0:
+                filt.undo_filter_block(a, self.row_bytes, block_end)
+                if rowview is None:
+                    rows = a
+                else:
+                    rows = rowview(a)
+                for offset in range(1, block_end, rb_1):
+                    yield rows[offset:offset + self.row_bytes]
+                del rows
+            rest = end - block_end
+            a[:rest] = a[block_end:end]
+
+        if rest != 0:
             # :file:format We get here with a file format error:
             # when the available bytes (after decompressing) do not
             # pack into exact rows.
             raise FormatError(
               'Wrong size for decompressed IDAT chunk.')
-        assert len(a) == 0
 
     def validate_signature(self):
         """If signature (header) has not been read then read and validate it"""
@@ -2366,6 +3522,11 @@ class Reader(object):
         self.signature = self.file.read(8)
         if self.signature != png_signature:
             raise FormatError("PNG file has invalid signature.")
+        # Position of the first chunk, known for seekable input only
+        try:
+            self.chunks_start = self.file.tell()
+        except (AttributeError, EnvironmentError, ValueError):
+            self.chunks_start = None
 
     def preamble(self, lenient=False):
         """
@@ -2407,8 +3568,36 @@ class Reader(object):
         if length > 2**31-1:
             raise FormatError('Chunk %s is too large: %d.' % (chunk_type,
                                                               length))
+        # length, type and checksum
+        self.chunks_total += length + 12
+        if self.max_chunks_total is not None and\
+                self.chunks_total > self.max_chunks_total:
+            raise LimitError('Chunks exceed limit of %d bytes.' %
+                             self.max_chunks_total)
         return length, chunk_type
 
+    def _count_decompressed(self, length):
+        """Count decompressed data, checking the limit."""
+        self.decompressed += length
+        if self.max_decompressed is not None and\
+                self.decompressed > self.max_decompressed:
+            raise LimitError('Decompressed data exceed limit of %d bytes.' %
+                             self.max_decompressed)
+
+    def _decompress(self, data):
+        """Decompress ancillary chunk data, checking the limit."""
+        if self.max_decompressed is None:
+            res = zlib.decompress(data)
+        else:
+            d = zlib.decompressobj()
+            # One byte above the limit is enough to find it exceeded.
+            # Whole output is returned by this call unless the limit is
+            # reached, so no flush (it is not bounded).
+            res = d.decompress(data,
+                               self.max_decompressed - self.decompressed + 1)
+        self._count_decompressed(len(res))
+        return res
+
     def process_chunk(self, lenient=False):
         """
         Process the next chunk and its data.
@@ -2460,6 +3649,25 @@ class Reader(object):
         if int(self.psize) == self.psize:
             self.psize = int(self.psize)
         self.row_bytes = int(math.ceil(self.width * self.psize))
+
+        if self.max_pixels is not None and\
+                self.width * self.height > self.max_pixels:
+            raise LimitError('Image size %dx%d exceeds limit of %d pixels.' %
+                             (self.width, self.height, self.max_pixels))
+        if self.max_decompressed is not None:
+            if self.interlace:
+                size = 0
+                for xstart, ystart, xstep, ystep in _adam7:
+                    if xstart >= self.width or ystart >= self.height:
+                        continue
+                    ppr = int(math.ceil((self.width - xstart) / float(xstep)))
+                    pass_rows = (self.height - ystart - 1 + ystep) // ystep
+                    size += pass_rows * (int(math.ceil(self.psize * ppr)) + 1)
+            else:
+                size = self.height * (self.row_bytes + 1)
+            if self.decompressed + size > self.max_decompressed:
+                raise LimitError('Image data (%d bytes) exceed limit of'
+                                 ' %d bytes.' % (size, self.max_decompressed))
         # Stores PLTE chunk if present, and is used to check
         # chunk ordering constraints.
         self.plte = None
@@ -2531,7 +3739,7 @@ class Reader(object):
         compression = data[i:i + 1]
         # TODO: Raise FormatError
         assert (compression == zerobyte)
-        icc_profile_string = zlib.decompress(data[i + 2:])
+        icc_profile_string = self._decompress(data[i + 2:])
         self.icc_profile = (icc_profile_name, icc_profile_string)
 
     def _process_sBIT(self, data):
@@ -2571,7 +3779,7 @@ class Reader(object):
             pass
         # TODO: Raise FormatError
         assert data[i:i + 1] == zerobyte
-        text = zlib.decompress(data[i + 2:]).decode('latin-1')
+        text = self._decompress(data[i + 2:]).decode('latin-1')
         self.text[keyword] = text
 
     def _process_iTXt(self, data):
@@ -2618,6 +3826,7 @@ class Reader(object):
                 raise ChunkError(e.args[0])
             if chunk_type == 'IEND':
                 # http://www.w3.org/TR/PNG/#11IEND
+                self.crc_report(lenient)
                 break
             if chunk_type != 'IDAT':
                 continue
@@ -2628,18 +3837,42 @@ class Reader(object):
             yield data
 
     def idatdecomp(self, lenient=False, max_length=0):
-        """Iterator that yields decompressed ``IDAT`` strings."""
-        # Currently, with no max_length paramter to decompress, this
-        # routine will do one yield per IDAT chunk.  So not very
-        # incremental.
-        d = zlib.decompressobj()
+        """
+        Iterator that yields decompressed ``IDAT`` strings.
+
+        When `max_length` is not 0 yielded strings are not longer,
+        otherwise there will be one yield per ``IDAT`` chunk.
+        With limit of decompressed data (see :class:`Reader`) strings
+        are never longer than 1 MiB.
+        """
+        if not max_length and self.max_decompressed is not None:
+            max_length = 2 ** 20
+        return self._decompress_chunks(zlib.decompressobj(),
+                                       self.idat(lenient), max_length)
+
+    def _decompress_chunks(self, d, chunks, max_length):
+        """Iterator that decompresses `chunks` with decompressor `d`"""
         # Each IDAT chunk is passed to the decompressor, then any
         # remaining state is decompressed out.
-        for data in self.idat(lenient):
-            # :todo: add a max_length argument here to limit output
-            # size.
-            yield bytearray(d.decompress(data))
-        yield bytearray(d.flush())
+        for data in chunks:
+            if not max_length:
+                block = d.decompress(data)
+                self._count_decompressed(len(block))
+                yield bytearray(block)
+                continue
+            # Chunk is passed by parts, so unconsumed tail which is
+            # copied on each call stays small.
+            for start in range(0, len(data), max_length):
+                part = data[start:start + max_length]
+                while part:
+                    block = d.decompress(part, max_length)
+                    part = d.unconsumed_tail
+                    if block:
+                        self._count_decompressed(len(block))
+                        yield bytearray(block)
+        block = d.flush()
+        self._count_decompressed(len(block))
+        yield bytearray(block)
 
     def read(self, lenient=False):
         """
@@ -2655,17 +3888,117 @@ class Reader(object):
         checksum failures will raise warnings rather than exceptions.
         """
         self.preamble(lenient=lenient)
-        raw = self.idatdecomp(lenient)
+        left, top, right, bottom = self._crop_box()
+        raw = self.idatdecomp(lenient, self.block_size)
+        # Cropped values of each row
+        vstart = left * self.planes
+        vstop = right * self.planes
 
         if self.interlace:
-            raw = bytearray(itertools.chain(*raw))
             arraycode = 'BH'[self.bitdepth > 8]
+            flat = self.deinterlace(raw)
+            vpr = self.width * self.planes
             # Like :meth:`group` but producing an array.array object for
             # each row.
-            pixels = map(lambda *row: array(arraycode, row),
-                       *[iter(self.deinterlace(raw))]*self.width*self.planes)
+            pixels = (array(arraycode, flat[start + vstart:start + vstop])
+                      for start in range(top * vpr, bottom * vpr, vpr))
+        else:
+            rows = self.iterstraight(raw)
+            if top or bottom != self.height:
+                # Rows out of region are not converted, reading stops
+                # after the last one
+                rows = itertools.islice(rows, top, bottom)
+            if vstop - vstart == self.width * self.planes:
+                pixels = self.iterboxed(rows)
+            elif self.bitdepth >= 8:
+                # Crop bytes before conversion
+                bps = self.bitdepth // 8
+                pixels = self.iterboxed(row[vstart * bps:vstop * bps]
+                                        for row in rows)
+            else:
+                pixels = (row[vstart:vstop] for row in self.iterboxed(rows))
+        pixels = self._crc_finish(pixels, lenient)
+        meta = self._metadata()
+        meta['size'] = (right - left, bottom - top)
+        return right - left, bottom - top, pixels, meta
+
+    def read_array(self, out=None, lenient=False):
+        """
+        Read the PNG file and decode it into NumPy array.
+
+        Returns (`width`, `height`, `pixels`, `metadata`) like
+        :meth:`read`, but `pixels` is ``numpy.ndarray`` of shape
+        (`height`, `width`, `planes`) with ``uint8`` samples for bitdepth
+        up to 8 and ``uint16`` samples in native byte order otherwise.
+        Samples are not rescaled and palette is not expanded.
+
+        Each unfiltered row is stored into the array by single
+        assignment.  If `out` is given it should be C-contiguous
+        writeable array of the right shape and type; it is filled and
+        returned, so one buffer may be reused for a series of images.
+
+        Raises ``ImportError`` when NumPy is not available.
+        """
+        if numpy is None:
+            raise ImportError("read_array requires NumPy")
+        self.preamble(lenient=lenient)
+        left, top, right, bottom = self._crop_box()
+        dtype = numpy.dtype(('uint8', 'uint16')[self.bitdepth > 8])
+        shape = (bottom - top, right - left, self.planes)
+        if out is None:
+            out = numpy.empty(shape, dtype)
+        elif out.shape != shape or out.dtype != dtype or\
+                not out.flags.c_contiguous or not out.flags.writeable:
+            raise ValueError("out should be writeable C-contiguous %s array"
+                             " of shape %r" % (dtype, shape))
+        raw = self.idatdecomp(lenient, self.block_size)
+        vstart = left * self.planes
+        vstop = right * self.planes
+
+        if self.interlace:
+            flat = numpy.frombuffer(self.deinterlace(raw), dtype)
+            flat = flat.reshape(self.height, self.width, self.planes)
+            out[...] = flat[top:bottom, left:right]
         else:
-            pixels = self.iterboxed(self.iterstraight(raw))
+            target = out.reshape(shape[0], -1)
+            rows = itertools.islice(self.iterstraight(raw), top, bottom)
+            for y, row in enumerate(rows):
+                if self.bitdepth == 16:
+                    # Byteswap (if needed) is done by assignment
+                    row = numpy.frombuffer(row, '>u2')
+                elif self.bitdepth < 8:
+                    row = numpy.frombuffer(
+                        unpack_samples(row, self.bitdepth, self.width),
+                        dtype)
+                else:
+                    row = numpy.frombuffer(row, dtype)
+                target[y] = row[vstart:vstop]
+        self.crc_report(lenient)
+        meta = self._metadata()
+        meta['size'] = (right - left, bottom - top)
+        return right - left, bottom - top, out, meta
+
+    def _crop_box(self):
+        """Region to decode as (left, top, right, bottom) tuple"""
+        if self.crop is None:
+            return 0, 0, self.width, self.height
+        left, top, right, bottom = self.crop
+        if left is None:
+            left = 0
+        if top is None:
+            top = 0
+        if right is None:
+            right = self.width
+        if bottom is None:
+            bottom = self.height
+        if not (0 <= left < right <= self.width and
+                0 <= top < bottom <= self.height):
+            raise ValueError("crop %r does not fit in image %dx%d" %
+                             (self.crop, self.width, self.height))
+        return left, top, right, bottom
+
+    def _metadata(self):
+        """Metadata dictionary of image, as returned by :meth:`read`"""
         meta = dict()
         for attr in 'greyscale alpha planes bitdepth interlace'.split():
             meta[attr] = getattr(self, attr)
@@ -2678,7 +4011,7 @@ class Reader(object):
                 meta[attr] = a
         if self.plte:
             meta['palette'] = self.palette()
-        return self.width, self.height, pixels, meta
+        return meta
 
     def read_flat(self):
         """
@@ -2695,8 +4028,190 @@ class Reader(object):
         """
         x, y, pixel, meta = self.read()
         arraycode = 'BH'[meta['bitdepth'] > 8]
-        pixel = array(arraycode, itertools.chain(*pixel))
-        return x, y, pixel, meta
+        flat = array(arraycode)
+        # Rows may share buffer in batched mode, so consume one by one
+        for row in pixel:
+            flat.extend(row)
+        return x, y, flat, meta
+
+    def build_index(self, interval=256, lenient=False):
+        """
+        Decode whole straightlaced image and record checkpoints.
+
+        Checkpoint is recorded every `interval` rows, it keeps position
+        in ``IDAT`` chunks, copy of decompressor state and previous
+        row, so :meth:`read_rows` can resume decoding from it.
+        Returns the list of checkpoints, which is also kept as
+        `row_index` attribute.  It could be passed to :meth:`read_rows`
+        of other :class:`Reader` of the same file.
+
+        Decompressor state could not be serialised, so index lives only
+        in memory.
+        """
+        self.preamble(lenient=lenient)
+        if self.interlace:
+            raise Error("Row index requires straightlaced image.")
+        rb_1 = self.row_bytes + 1
+        filt = Filter(self.bitdepth * self.planes)
+        d = zlib.decompressobj()
+        pending = bytearray()
+        row = 0
+        index = []
+        for data in self.idat(lenient):
+            # Position of chunk data in file
+            offset = self.file.tell() - 4 - len(data)
+            if not index:
+                index.append((0, offset, len(data), 0, d.copy(),
+                              None, bytes()))
+            part = data
+            while part:
+                # Single row at a time, so checkpoints are exact
+                block = d.decompress(part, rb_1)
+                part = d.unconsumed_tail
+                self._count_decompressed(len(block))
+                pending.extend(block)
+                while len(pending) >= rb_1:
+                    if pending[0] > 4:
+                        raise FormatError('Invalid PNG Filter Type.'
+                '  See http://www.w3.org/TR/2003/REC-PNG-20031110/#9Filters .')
+                    filt.undo_filter_block(pending, self.row_bytes, rb_1)
+                    del pending[:rb_1]
+                    row += 1
+                    if row % interval == 0 and row < self.height:
+                        index.append((row, offset, len(data),
+                                      len(data) - len(part), d.copy(),
+                                      bytearray_to_bytes(filt.prev),
+                                      bytearray_to_bytes(pending)))
+        if row != self.height:
+            raise FormatError('Wrong size for decompressed IDAT chunk.')
+        self.row_index = index
+        return index
+
+    def read_rows(self, start, stop, index=None, lenient=False):
+        """
+        Read rows from `start` up to `stop` using checkpoint index.
+
+        `index` is the result of :meth:`build_index`, by default
+        `row_index` of this reader.  Decoding resumes from the nearest
+        checkpoint before `start`, so the input should be seekable.
+        Returns an iterator of rows in boxed row flat pixel format.
+        """
+        if not hasattr(self, 'row_bytes'):
+            # Header is not read yet
+            self.preamble(lenient=lenient)
+        if index is None:
+            index = self.row_index
+        if not index:
+            raise Error("No row index, see build_index.")
+        if not 0 <= start < stop <= self.height:
+            raise ValueError("rows %d:%d out of image height %d" %
+                             (start, stop, self.height))
+        checkpoint = index[0]
+        for item in index:
+            if item[0] > start:
+                break
+            checkpoint = item
+        row, offset, length, pos, d, prev, pending = checkpoint
+        self.file.seek(offset + pos)
+        # Checksum of partially read chunk is not verified
+        data = self.file.read(length - pos)
+        self.file.read(4)
+        self.atchunk = None
+        chunks = itertools.chain([data], self.idat(lenient))
+        raw = itertools.chain(
+            [bytearray(pending)],
+            self._decompress_chunks(d.copy(), chunks, self.block_size))
+        rows = self.iterstraight(raw, prev)
+        return self._crc_finish(
+            self.iterboxed(itertools.islice(rows, start - row, stop - row)),
+            lenient)
+
+    def read_passes(self, lenient=False, preview=False):
+        """
+        Read a PNG file and decode it pass by pass.
+
+        Returns (*width*, *height*, *passes*, *metadata*).
+
+        `passes` is an iterator that yields ``(placement, rows,
+        preview_rows)`` as soon as each Adam7 pass is decoded, so
+        reading may be stopped after first passes to get low-resolution
+        image without decompressing the rest.  `placement` is
+        ``(xstart, ystart, xstep, ystep)`` of the pass and `rows` are rows
+        of reduced image of the pass in boxed row flat pixel format.
+
+        If `preview` is true then `preview_rows` are rows of full size
+        image where each pixel not decoded yet is replaced with the
+        nearest decoded one to the top left; otherwise it is ``None``.
+
+        Straightlaced image is yielded as single pass with placement
+        ``(0, 0, 1, 1)``.
+
+        IDAT is decompressed by blocks of `block_size` (see
+        :class:`Reader`), so use small blocks when only first passes of
+        big image are needed.
+        """
+        self.preamble(lenient=lenient)
+        raw = self.idatdecomp(lenient, self.block_size)
+        arraycode = 'BH'[self.bitdepth > 8]
+        # Values per row (of the target image)
+        vpr = self.width * self.planes
+
+        def straight():
+            rows = [array(arraycode, row)
+                    for row in self.iterboxed(self.iterstraight(raw))]
+            yield (0, 0, 1, 1), rows, (rows if preview else None)
+
+        def interlaced():
+            if preview:
+                # Pixels decoded so far
+                image = array(arraycode, [0]) * (vpr * self.height)
+            for xstart, ystart, xstep, ystep, ppr, flat in \
+                    self.iterpasses(raw):
+                # Values per row of the pass
+                vpp = ppr * self.planes
+                rows = [array(arraycode, flat[start:start + vpp])
+                        for start in range(0, len(flat), vpp)]
+                if not preview:
+                    yield (xstart, ystart, xstep, ystep), rows, None
+                    continue
+                for y, row in zip(range(ystart, self.height, ystep), rows):
+                    offset = y * vpr + xstart * self.planes
+                    for i in range(self.planes):
+                        image[offset + i:(y + 1) * vpr:
+                              self.planes * xstep] = row[i::self.planes]
+                # Decoded pixels form grid with these steps
+                if xstart:
+                    xgrid, ygrid = xstart, ystep
+                else:
+                    xgrid, ygrid = xstep, ystart or ystep
+                yield ((xstart, ystart, xstep, ystep), rows,
+                       self._replicate(image, xgrid, ygrid))
+
+        passes = (straight, interlaced)[bool(self.interlace)]()
+        passes = self._crc_finish(passes, lenient)
+        return self.width, self.height, passes, self._metadata()
+
+    def _replicate(self, image, xgrid, ygrid):
+        """
+        Fill the whole image from pixels on grid with given steps
+
+        `image` is in flat row flat pixel format, result is list of rows.
+        """
+        vpr = self.width * self.planes
+        res = []
+        for y in range(self.height):
+            if y % ygrid:
+                res.append(array(image.typecode, res[-1]))
+                continue
+            row = image[y * vpr:(y + 1) * vpr]
+            step = xgrid * self.planes
+            for dx in range(1, min(xgrid, self.width)):
+                for i in range(self.planes):
+                    target = row[dx * self.planes + i::step]
+                    row[dx * self.planes + i::step] = \
+                        row[i::step][:len(target)]
+            res.append(row)
+        return res
 
     def palette(self, alpha='natural'):
         """
@@ -2772,43 +4287,85 @@ class Reader(object):
             meta['bitdepth'] = 8
             meta['planes'] = 3 + bool(self.trns)
             plte = self.palette()
+            planes = meta['planes']
+            # One translation table per output channel, indexes out of
+            # palette are checked separately
+            pad = [0] * (256 - len(plte))
+            tables = [bytearray_to_bytes(bytearray([entry[i] for entry in plte]
+                                                   + pad))
+                      for i in range(planes)]
 
             def iterpal(pixels):
                 for row in pixels:
-                    row = [plte[i] for i in row]
-                    yield bytearray(itertools.chain(*row))
+                    if not isinstance(row, bytearray):
+                        row = bytearray(row)
+                    if pad and row and max(row) >= len(plte):
+                        raise FormatError(
+                          "Palette index %d is out of palette of %d entries."
+                          % (max(row), len(plte)))
+                    out = bytearray(len(row) * planes)
+                    for i, table in enumerate(tables):
+                        out[i::planes] = row.translate(table)
+                    yield out
             pixels = iterpal(pixels)
         elif self.trns:
-            # It would be nice if there was some reasonable way
-            # of doing this without generating a whole load of
-            # intermediate tuples.  But tuples does seem like the
-            # easiest way, with no other way clearly much simpler or
-            # much faster.  (Actually, the L to LA conversion could
-            # perhaps go faster (all those 1-tuples!), but I still
-            # wonder whether the code proliferation is worth it)
             it = self.transparent
             maxval = 2**meta['bitdepth'] - 1
             planes = meta['planes']
             meta['alpha'] = True
             meta['planes'] += 1
             if meta['bitdepth'] > 8:
-                def wrap_array(row):
+                dtype = 'uint16'
+                new_row = newHarray
+
+                def as_row(row):
+                    if isinstance(row, array):
+                        return row
                     return array('H', row)
             else:
-                wrap_array = bytearray
+                dtype = 'uint8'
+                new_row = newBarray
+                # Per channel tables to get 0 for transparent value
+                # and maxval for others
+                tables = [bytearray_to_bytes(bytearray(
+                    [maxval * (i != t) for i in range(256)])) for t in it]
+
+                def as_row(row):
+                    if isinstance(row, bytearray):
+                        return row
+                    return bytearray(row)
+
+            def opacity(row):
+                """Alpha channel for whole row of pure Python values"""
+                if dtype == 'uint8':
+                    ne = [row[i::planes].translate(table)
+                          for i, table in enumerate(tables)]
+                    if planes == 1:
+                        return ne[0]
+                    return bytearray(map(max, *ne))
+                ne = [map(functools.partial(operator.ne, t), row[i::planes])
+                      for i, t in enumerate(it)]
+                if planes > 1:
+                    ne = [map(max, *ne)]
+                return array('H', [maxval * opaque for opaque in ne[0]])
 
             def itertrns(pixels):
                 for row in pixels:
-                    # For each row we group it into pixels, then form a
-                    # characterisation vector that says whether each
-                    # pixel is opaque or not.  Then we convert
-                    # True/False to 0/maxval (by multiplication),
-                    # and add it as the extra channel.
-                    row = group(row, planes)
-                    opa = [maxval * (it != i) for i in row]
-                    opa = zip(opa)  # convert to 1-tuples
-                    yield wrap_array(itertools.chain(*list(map(operator.add,
-                                                               row, opa))))
+                    row = as_row(row)
+                    out = new_row(len(row) // planes * (planes + 1))
+                    if numpy is not None:
+                        # Whole row is compared at once
+                        px = numpy.frombuffer(row, dtype).reshape(-1, planes)
+                        target = numpy.frombuffer(out, dtype).reshape(
+                            -1, planes + 1)
+                        target[:, :planes] = px
+                        target[:, planes] = (px != it).any(1) * maxval
+                    else:
+                        # Channels are interleaved by strided assignment
+                        for i in range(planes):
+                            out[i::planes + 1] = row[i::planes]
+                        out[planes::planes + 1] = opacity(row)
+                    yield out
             pixels = itertrns(pixels)
         targetbitdepth = None
         if self.sbit:
@@ -18,7 +18,7 @@ cdef inline buf_arr newBarray(int length):
 	return res
 
 cdef class BaseFilter:
-	cdef int fu
+	cdef public int fu
 	cdef public buf_arr prev
 
 	@cython.locals(ai = cython.int, i=cython.int, x=cython.uchar, a=cython.uchar)
@@ -45,6 +45,8 @@ cdef class BaseFilter:
 	@cython.locals(ai = cython.int, i=cython.int, x=cython.uchar, a=cython.uchar, b=cython.uchar, c=cython.uchar, pa=cython.uchar, pb=cython.uchar, pc=cython.int, pr=cython.uchar, previous=buf_arr)
 	cdef void __do_filter_paeth(self, unsigned char[::1] scanline, unsigned char[::1] result)
 
+	cpdef _unfilter_scanline(self, int filter_type, unsigned char[::1] line)
+
 	cpdef undo_filter(self, int filter_type, unsigned char[::1] line)
 
 	cpdef _filter_scanline(self, int filter_type, unsigned char[::1] line, unsigned char[::1] result)
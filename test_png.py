@@ -203,6 +203,35 @@ class Test(unittest.TestCase):
         self.assertEqual([list(it) for it in pixels],
                          [list(it) for it in flat])
 
+    def testPaletteIndex(self):
+        """Palette index out of palette is format error"""
+        w = png.Writer(3, 1, bitdepth=2, palette=[(1, 2, 3), (4, 5, 6)])
+        f = BytesIO()
+        w.write_array(f, array('B', (1, 0, 3)))
+        pixels = png.Reader(bytes=f.getvalue()).asDirect()[2]
+        self.assertRaises(png.FormatError, list, pixels)
+
+    def testTrnsAlpha(self):
+        """Alpha channel synthesized from tRNS for every colour type"""
+        for greyscale, bitdepth in itertools.product((True, False),
+                                                     (2, 8, 16)):
+            if bitdepth == 2 and not greyscale:
+                continue
+            planes = 1 + 2 * (not greyscale)
+            maxval = 2 ** bitdepth - 1
+            transparent = (1, 2, 3)[:planes]
+            pixels = [(1, 2, 3)[:planes], (1, 1, 1)[:planes],
+                      (maxval,) * planes, (1, 2, 3)[:planes]]
+            w = png.Writer(2, 2, greyscale=greyscale, bitdepth=bitdepth,
+                           transparent=transparent)
+            f = BytesIO()
+            w.write_array(f, list(itertools.chain(*pixels)))
+            rows = png.Reader(bytes=f.getvalue()).asDirect()[2]
+            expected = [list(px) + [maxval * (px != transparent)]
+                        for px in pixels]
+            expected = [expected[0] + expected[1], expected[2] + expected[3]]
+            self.assertEqual([list(row) for row in rows], expected)
+
     def testRGBtoRGBA(self):
         """asRGBA8() on colour type 2 source."""
         # Also test that png.Reader can take a "file-like" object.
@@ -269,6 +298,20 @@ class Test(unittest.TestCase):
             self.assertEqual([list(it) for it in straight],
                              [list(it) for it in adam7])
 
+    def testBatched(self):
+        """Test that batched mode reads same rows as usual."""
+        for candidate in pngsuite.png:
+            # Basic, filtering, IDAT splitting and compression tests
+            if candidate[:2] not in ('ba', 'f0', 'oi', 'z0'):
+                continue
+            pngsuite.png[candidate].seek(0)
+            usual = png.Reader(bytes=pngsuite.png[candidate].read())
+            pngsuite.png[candidate].seek(0)
+            batched = png.Reader(bytes=pngsuite.png[candidate].read(),
+                                 batched=True)
+            self.assertEqual([list(it) for it in usual.asDirect()[2]],
+                             [list(it) for it in batched.asDirect()[2]])
+
     def testAdam7write(self):
         """
         Adam7 interlace writing.
@@ -625,6 +668,71 @@ class Test(unittest.TestCase):
         info = r.read()[3]
         self.assertEqual(info['rendering_intent'], png.PERCEPTUAL)
 
+    def testParallelCompression(self):
+        """Test writing with parallel compression."""
+        pixels = [[(x * y + y) % 256 for x in range(100)] for y in range(70)]
+        w = png.Writer(100, 70, greyscale=True, filter_type='sum')
+        w.set_parallel(4, 1000)
+        o = BytesIO()
+        w.write(o, pixels)
+        r = png.Reader(bytes=o.getvalue())
+        idat = [data for chunk_type, data in r.chunks()
+                if chunk_type == 'IDAT']
+        self.assertTrue(len(idat) > 1)
+        # zlib header is not written as separate chunk
+        self.assertTrue(min(map(len, idat)) > 2)
+        # zlib checks stream integrity including Adler-32
+        self.assertEqual(len(zlib.decompress(strtobytes('').join(idat))),
+                         70 * 101)
+        r = png.Reader(bytes=o.getvalue())
+        self.assertEqual([list(row) for row in r.read()[2]], pixels)
+
+    def testBlockSize(self):
+        """Test decompression with limited block size."""
+        pixels = [[(x * y) % 256 for x in range(300)] for y in range(200)]
+        o = BytesIO()
+        png.Writer(300, 200, greyscale=True).write(o, pixels)
+        r = png.Reader(bytes=o.getvalue())
+        r.preamble()
+        blocks = list(r.idatdecomp(max_length=1000))
+        self.assertTrue(max(map(len, blocks)) <= 1000)
+        self.assertEqual(sum(map(len, blocks)), 200 * 301)
+        r = png.Reader(bytes=o.getvalue(), block_size=1000)
+        self.assertEqual([list(row) for row in r.read()[2]], pixels)
+
+    def testLimits(self):
+        """Test Reader limits against "bombs"."""
+        o = BytesIO()
+        png.Writer(300, 200, greyscale=True, compression=9).write(
+            o, [[0] * 300] * 200)
+        bomb = o.getvalue()
+        png.Reader(bytes=bomb, max_pixels=300 * 200,
+                   max_decompressed=200 * 301,
+                   max_chunks_total=len(bomb)).read()
+        r = png.Reader(bytes=bomb, max_pixels=300 * 199)
+        self.assertRaises(png.LimitError, r.preamble)
+        r = png.Reader(bytes=bomb, max_decompressed=200 * 301 - 1)
+        self.assertRaises(png.LimitError, r.preamble)
+        r = png.Reader(bytes=bomb, max_chunks_total=100)
+        self.assertRaises(png.LimitError, lambda: list(r.read()[2]))
+        # Extra data beyond the image are decompressed incrementally
+        o = BytesIO()
+        bomb_header = bomb[16:29]
+        bomb = zlib.compress(bytes(bytearray(10 ** 7)))
+        png.write_chunks(o, [('IHDR', bomb_header), ('IDAT', bomb),
+                             ('IEND', strtobytes(''))])
+        r = png.Reader(bytes=o.getvalue(), max_decompressed=10 ** 6)
+        self.assertRaises(png.LimitError, lambda: list(r.read()[2]))
+        # Compressed ancillary chunks
+        for chunk in (('zTXt', strtobytes('Comment\0\0') + bomb),
+                      ('iCCP', strtobytes('Profile\0\0') + bomb)):
+            o = BytesIO()
+            png.write_chunks(o, [('IHDR', bomb_header), chunk,
+                                 ('IEND', strtobytes(''))])
+            r = png.Reader(bytes=o.getvalue(), max_decompressed=10 ** 6)
+            self.assertRaises(png.LimitError, r.preamble)
+            self.assertTrue(r.decompressed <= 10 ** 6 + 1)
+
     def testPackedIter(self):
         """Test iterator for row when using write_packed."""
         w = png.Writer(16, 2, greyscale=True, alpha=False, bitdepth=1)
@@ -713,6 +821,99 @@ class Test(unittest.TestCase):
         pixels = r.asDirect()[2]
         self.assertRaises(png.FormatError, list, pixels)
 
+    def testFilterInto(self):
+        """Filtering into reused buffers gives the same result"""
+        lines = [bytearray([(x * y * 7 + x) % 256 for x in range(12)])
+                 for y in range(4)]
+        for filter_type in range(5):
+            expected = []
+            reference = png.Filter(24)
+            for line in lines:
+                line = bytearray(line)
+                res = bytearray(line)
+                reference._filter_scanline(filter_type, line, res)
+                res.insert(0, filter_type)
+                reference.prev = line
+                expected.append(res)
+            for method in ('do_filter', 'do_filter_into'):
+                filter_ = png.Filter(24)
+                res = [bytearray(getattr(filter_, method)(filter_type, line))
+                       for line in lines]
+                self.assertEqual(res, expected)
+
+    def testWriteArrayBuffer(self):
+        """Writing bytes-like arrays without per-sample conversion"""
+        flat = bytearray((x * 7 + y * 3) % 256
+                         for y in range(5) for x in range(18))
+        expected = BytesIO()
+        png.Writer(6, 5).write_array(expected, list(flat))
+        for pixels in (bytes(flat), flat, array('B', flat)):
+            if png.png.bufview is not None:
+                self.assertIsNotNone(
+                    png.Writer(6, 5).buffer_scanlines(pixels))
+            out = BytesIO()
+            png.Writer(6, 5).write_array(out, pixels)
+            self.assertEqual(out.getvalue(), expected.getvalue())
+        # Size mismatch falls back to ordinary path
+        self.assertIsNone(png.Writer(6, 4).buffer_scanlines(flat))
+
+    def testBufferSize(self):
+        """Test collecting chunks into output buffer"""
+        class CountingIO(BytesIO):
+            """BytesIO which counts writes"""
+            writes = 0
+
+            def write(self, data):
+                self.writes += 1
+                return BytesIO.write(self, data)
+
+        rows = [[(x * y) % 256 for x in range(40)] for y in range(30)]
+        res = []
+        for buffer_size in (None, 2 ** 16):
+            out = CountingIO()
+            png.Writer(40, 30, greyscale=True, chunk_limit=100,
+                       buffer_size=buffer_size).write(out, rows)
+            res.append((out.getvalue(), out.writes))
+        self.assertEqual(res[0][0], res[1][0])
+        self.assertEqual(res[1][1], 1)
+        # One write for signature and each chunk
+        self.assertEqual(res[0][1], len(list(png.Reader(
+            bytes=res[0][0]).chunk_directory())) + 1)
+
+    def testCrcPolicy(self):
+        """Checksum verification policies"""
+        for crc in ('all', 'critical', 'background'):
+            pngsuite.png['xcsn0g01'].seek(0)
+            r = png.Reader(pngsuite.png['xcsn0g01'], crc=crc)
+            pixels = r.asDirect()[2]
+            self.assertRaises(png.ChunkError, list, pixels)
+        pngsuite.png['xcsn0g01'].seek(0)
+        r = png.Reader(pngsuite.png['xcsn0g01'], crc='none')
+        self.assertEqual(len(list(r.asDirect()[2])), 32)
+        report = r.crc_report()
+        self.assertEqual(report['checked'], 0)
+        self.assertEqual(report['errors'], [])
+        self.assertTrue(report['skipped'] > 0)
+        pngsuite.png['basn0g01'].seek(0)
+        r = png.Reader(pngsuite.png['basn0g01'], crc='background')
+        self.assertEqual(len(list(r.asDirect()[2])), 32)
+        self.assertEqual(r.crc_report()['errors'], [])
+        # Reading stopped before the end of image
+        pngsuite.png['xcsn0g01'].seek(0)
+        data = pngsuite.png['xcsn0g01'].read()
+        r = png.Reader(bytes=data, crc='background', crop=(None, 0, None, 1))
+        self.assertRaises(png.ChunkError, list, r.asDirect()[2])
+        self.assertTrue(r.crc_pool is None)
+        if png.png.ThreadPoolExecutor is not None:
+            # Without thread pool checksums are verified immediately
+            r = png.Reader(bytes=data, crc='background')
+            pixels = r.read()[2]
+            next(pixels)
+            pixels.close()
+            self.assertTrue(r.crc_pool is None)
+            self.assertRaises(png.ChunkError, r.crc_report)
+        self.assertRaises(ValueError, png.Reader, bytes=bytes(), crc='some')
+
     def testBadSignature(self):
         """Tests for bad signature"""
         # signature byte 1 MSBit reset to zero
@@ -861,6 +1062,16 @@ class Test(unittest.TestCase):
         f = BytesIO()
         img.save(f)
 
+    def testfromarray3D(self):
+        """Test writing from 3-dimensional sequence"""
+        rows = [[(x, y, x + y) for x in range(4)] for y in range(3)]
+        f = BytesIO()
+        png.from_array(rows, 'RGB').save(f)
+        r = png.Reader(bytes=f.getvalue())
+        self.assertEqual([list(row) for row in r.read()[2]],
+                         [[c for px in row for c in px] for row in rows])
+        self.assertRaises(png.Error, png.from_array, rows, 'LA')
+
     def testfromarrayWrong(self):
         """Test incorrect mode handling"""
         try:
@@ -960,6 +1171,118 @@ class Test(unittest.TestCase):
         out = filter_.undo_filter(scanline[0], scanline[1:])
         self.assertEqual(list(out), [8, 10, 9, 108, 111, 113])  # paeth
 
+    def testUnpackSamples(self):
+        """Test unpacking of samples with bitdepth < 8"""
+        raw = bytearray([0xb4, 0xff, 0x1e, 0x00])
+        self.assertEqual(list(png.png.unpack_samples(raw, 2, 7)),
+                         [2, 3, 1, 0, 3, 3, 3, 0, 1, 3, 2, 0, 0, 0])
+        self.assertEqual(list(png.png.unpack_samples(raw[:1], 1, 3)),
+                         [1, 0, 1])
+        self.assertEqual(list(png.png.unpack_samples(raw, 4, 1)),
+                         [11, 15, 1, 0])
+
+    def testPackSamples(self):
+        """Test packing of samples with bitdepth < 8"""
+        self.assertEqual(png.png.pack_samples([1, 0, 1], 1),
+                         bytearray([0xa0]))
+        self.assertEqual(png.png.pack_samples([2, 3, 1, 0, 3, 3], 2),
+                         bytearray([0xb4, 0xf0]))
+        self.assertEqual(png.png.pack_samples([11, 15, 1], 4),
+                         bytearray([0xbf, 0x10]))
+
+    def testChunkDirectory(self):
+        """Test scanning chunks without reading image data"""
+        pngsuite.png['Arc-cHRM-rgswap'].seek(0)
+        r = png.Reader(bytes=pngsuite.png['Arc-cHRM-rgswap'].read())
+        directory = r.chunk_directory()
+        self.assertEqual([it[0] for it in directory],
+                         ['IHDR', 'gAMA', 'cHRM', 'PLTE', 'IDAT',
+                          'tEXt', 'tEXt', 'tIME', 'IEND'])
+        self.assertEqual(r.chunk_data(directory[1], verify=True),
+                         struct.pack('!I', 45455))
+        meta = r.scan_metadata(('tEXt',))
+        self.assertEqual(meta['size'], (64, 64))
+        self.assertTrue('Title' in meta['text'])
+        self.assertFalse('last_mod_time' in meta)
+        # Reading still starts from the beginning
+        self.assertEqual(len(list(r.read()[2])), 64)
+
+        class Stream(object):
+            """Input without seek and tell"""
+            def __init__(self, data):
+                self.read = BytesIO(data).read
+
+        pngsuite.png['basn0g01'].seek(0)
+        r = png.Reader(file=Stream(pngsuite.png['basn0g01'].read()))
+        self.assertRaises(png.Error, r.chunk_directory)
+
+    def testMmap(self):
+        """Test reading memory-mapped file"""
+        s = os.path.join(os.path.dirname(__file__),
+                         'testfiles', 'glenda.png')
+        ref = png.Reader(filename=s).read_flat()
+        r = png.Reader(filename=s, mmap=True)
+        res = r.read_flat()
+        self.assertEqual(res[2], ref[2])
+        self.assertEqual(res[3], ref[3])
+        del r
+
+    def testRowIndex(self):
+        """Test reading rows with checkpoint index"""
+        rows = [[(x * y + x) % 256 for x in range(30)] for y in range(40)]
+        out = BytesIO()
+        png.Writer(30, 40, greyscale=True, chunk_limit=50).write(out, rows)
+        r = png.Reader(bytes=out.getvalue())
+        index = r.build_index(interval=8)
+        self.assertEqual([it[0] for it in index], [0, 8, 16, 24, 32])
+        self.assertEqual([list(row) for row in r.read_rows(17, 25)],
+                         rows[17:25])
+        r = png.Reader(bytes=out.getvalue())
+        self.assertEqual([list(row) for row in r.read_rows(3, 40, index)],
+                         rows[3:])
+
+    def testCrop(self):
+        """Test decoding of image region"""
+        rows = [[x * 10 + y for x in range(10)] for y in range(9)]
+        for interlace in (False, True):
+            out = BytesIO()
+            png.Writer(10, 9, greyscale=True,
+                       interlace=interlace).write(out, rows)
+            r = png.Reader(bytes=out.getvalue(), crop=(2, 1, 5, 3))
+            x, y, pixels, meta = r.asDirect()
+            self.assertEqual((x, y), (3, 2))
+            self.assertEqual(meta['size'], (3, 2))
+            self.assertEqual([list(row) for row in pixels],
+                             [[21, 31, 41], [22, 32, 42]])
+            r = png.Reader(bytes=out.getvalue(), crop=(None, 7, None, None))
+            self.assertEqual([list(row) for row in r.read()[2]], rows[7:])
+        r = png.Reader(bytes=out.getvalue(), crop=(0, 0, 11, 1))
+        self.assertRaises(ValueError, r.read)
+
+    def testReadPasses(self):
+        """Test pass by pass decoding of interlaced image"""
+        rows = [[x * 10 + y for x in range(10)] for y in range(9)]
+        out = BytesIO()
+        png.Writer(10, 9, greyscale=True, interlace=True).write(out, rows)
+        r = png.Reader(bytes=out.getvalue(), block_size=8)
+        passes = r.read_passes(preview=True)[2]
+        placement, reduced, preview = next(passes)
+        self.assertEqual(placement, (0, 0, 8, 8))
+        self.assertEqual([list(row) for row in reduced], [[0, 80], [8, 88]])
+        self.assertEqual(list(preview[3]), [0] * 8 + [80] * 2)
+        self.assertEqual(list(preview[8]), [8] * 8 + [88] * 2)
+        self.assertTrue(r.decompressed < 9 * 11)
+        for placement, reduced, preview in passes:
+            pass
+        self.assertEqual(placement, (0, 1, 1, 2))
+        self.assertEqual([list(row) for row in preview], rows)
+
+    def testPackWords(self):
+        """Test conversion of 16-bit samples to and from bytes"""
+        raw = bytearray([0x12, 0x34, 0xff, 0x00])
+        self.assertEqual(png.png.pack_words([0x1234, 0xff00]), raw)
+        self.assertEqual(list(png.png.unpack_words(raw)), [0x1234, 0xff00])
+
     def testModifyRows(self):
         """
         Tests that the rows yielded by the pixels generator
@@ -1286,6 +1609,168 @@ try:
             img = png.from_array(pixels, 'L')
             img.save(BytesIO())
 
+        def testNumpyarray3D(self):
+            """3-dimensional numpy array."""
+            for dtype, mode, planes in (('uint8', 'RGB', 3),
+                                        ('uint16', 'LA;16', 2),
+                                        ('>u2', None, 4),
+                                        ('uint8', 'L;4', 1)):
+                pixels = numpy.arange(5 * 7 * planes, dtype=dtype) % 16
+                pixels = pixels.reshape(5, 7, planes)
+                f = BytesIO()
+                png.from_array(pixels, mode).save(f)
+                r = png.Reader(bytes=f.getvalue())
+                rows = [list(row) for row in r.read()[2]]
+                self.assertEqual(rows, pixels.reshape(5, -1).tolist())
+
+        def testNumpyReadArray(self):
+            """Decoding into NumPy array"""
+            for name in ('basn0g01', 'basn0g16', 'basn2c08', 'basn3p04',
+                         'basn6a16', 'basi4a08', 'basi2c16'):
+                for crop in (None, (3, 5, 30, 17)):
+                    pngsuite.png[name].seek(0)
+                    data = pngsuite.png[name].read()
+                    x, y, rows, _ = png.Reader(bytes=data, crop=crop).read()
+                    expected = [list(row) for row in rows]
+                    r = png.Reader(bytes=data, crop=crop)
+                    res = r.read_array()[2]
+                    self.assertEqual(res.shape, (y, x, r.planes))
+                    self.assertEqual(res.dtype.itemsize, 1 + (r.bitdepth > 8))
+                    self.assertEqual(res.reshape(y, -1).tolist(), expected)
+                    # Reuse of output buffer
+                    res[...] = 0
+                    out = png.Reader(bytes=data, crop=crop).read_array(res)[2]
+                    self.assertTrue(out is res)
+                    self.assertEqual(res.reshape(y, -1).tolist(), expected)
+            self.assertRaises(ValueError,
+                              png.Reader(bytes=data).read_array,
+                              numpy.empty((1, 1, 3), 'uint16'))
+
+        def testNumpyRowsBuffer(self):
+            """8-bit NumPy rows are filtered as buffers, not as ints"""
+            class Row(numpy.ndarray):
+                """Row which fails conversion by iteration"""
+                def __iter__(self):
+                    raise TypeError("row is iterated")
+
+            pixels = (numpy.arange(6 * 4) * 9).astype(numpy.uint8)
+            rows = [row.view(Row) for row in pixels.reshape(4, 6)]
+            res = []
+            for source in (rows, pixels.reshape(4, 6).tolist()):
+                out = BytesIO()
+                png.Writer(2, 4).write(out, source)
+                res.append(out.getvalue())
+            self.assertEqual(res[0], res[1])
+
+        def testNumpyFilters(self):
+            """NumPy filters give same result as pure python"""
+            prev = array('B', [20, 21, 22, 210, 211, 212, 0, 255, 7])
+            line = array('B', [30, 32, 34, 230, 233, 236, 255, 0, 9])
+            for prev_ in (None, prev):
+                for filter_type in range(5):
+                    res = []
+                    for base in (png.png.iBaseFilter, png.png.NumpyBaseFilter):
+                        filter_ = base(24)
+                        filter_.prev = prev_ and bytearray(prev_)
+                        filtered = bytearray(line)
+                        filter_._filter_scanline(filter_type, line, filtered)
+                        filter_.prev = prev_ and bytearray(prev_)
+                        unfiltered = bytearray(line)
+                        filter_.undo_filter(filter_type, unfiltered)
+                        res.append((filtered, unfiltered))
+                    self.assertEqual(res[0], res[1])
+
+        def testNumpyFilterBlock(self):
+            """Undo filters for block of scanlines with NumPy"""
+            block = bytearray()
+            for filter_type in (2, 2, 0, 2, 1, 3, 2, 2, 4, 2):
+                block.append(filter_type)
+                block.extend(range(filter_type * 20, filter_type * 20 + 6))
+            res = []
+            for base in (png.png.iBaseFilter, png.png.NumpyBaseFilter):
+                filter_ = base(16)
+                filter_.prev = None
+                data = bytearray(block)
+                filter_.undo_filter_block(data, 6)
+                res.append((data, filter_.prev))
+            self.assertEqual(res[0], res[1])
+
+        def testNumpyAdaptiveBlock(self):
+            """Adaptive filters for block of lines with NumPy"""
+            lines = [bytearray([(x * y * 7 + x // (y + 1)) % 256
+                                for x in range(30)]) for y in range(17)]
+            for strategy in ('sum', 'entropy'):
+                for interlace in (False, True):
+                    filter_ = png.Filter(24, interlace, 17)
+                    expected = bytearray()
+                    for line in lines:
+                        expected.extend(filter_.do_filter(strategy, line))
+                    filter_ = png.Filter(24, interlace, 17)
+                    res = filter_.do_filter_block(strategy, list(lines))
+                    self.assertEqual(res, expected)
+
+        def testNumpyInterlace(self):
+            """Interlaced writing of NumPy array"""
+            pixels = numpy.arange(13 * 11 * 3,
+                                  dtype=numpy.uint16).reshape(11, 13 * 3)
+            for bitdepth in (16, 8):
+                pixels &= 2 ** bitdepth - 1
+                res = []
+                for rows in (pixels, pixels.tolist()):
+                    out = BytesIO()
+                    png.Writer(13, 11, bitdepth=bitdepth,
+                               interlace=True).write(out, rows)
+                    res.append(out.getvalue())
+                self.assertEqual(res[0], res[1])
+                flats = [pixels.reshape(-1).tolist()]
+                if bitdepth == 8:
+                    flats.append(pixels.astype('uint8').tobytes())
+                    flats.append(bytearray(flats[-1]))
+                    flats.append(memoryview(flats[-1]))
+                flats.append(pixels.reshape(-1))
+                for flat in flats:
+                    out = BytesIO()
+                    w = png.Writer(13, 11, bitdepth=bitdepth, interlace=True)
+                    if not isinstance(flat, list):
+                        # Buffers are not converted by generic method
+                        w.array_scanlines_interlace = None
+                    w.write_array(out, flat)
+                    self.assertEqual(out.getvalue(), res[0])
+                rows = png.Reader(bytes=res[0]).read()[2]
+                self.assertEqual([list(row) for row in rows],
+                                 pixels.tolist())
+
+        def testNumpyWriteArray(self):
+            """Writing NumPy array as buffer"""
+            pixels = numpy.arange(13 * 11 * 3,
+                                  dtype=numpy.uint16).reshape(11, 13 * 3)
+            for bitdepth in (16, 8):
+                pixels &= 2 ** bitdepth - 1
+                expected = BytesIO()
+                png.Writer(13, 11, bitdepth=bitdepth).write_array(
+                    expected, pixels.reshape(-1).tolist())
+                for dtype in ('uint8', 'uint16', '>u2', 'int32'):
+                    arr = pixels.astype(dtype)
+                    if arr.dtype.itemsize * 8 < bitdepth:
+                        continue
+                    out = BytesIO()
+                    png.Writer(13, 11, bitdepth=bitdepth).write_array(out,
+                                                                      arr)
+                    self.assertEqual(out.getvalue(), expected.getvalue())
+                    if bitdepth == 8:
+                        out = BytesIO()
+                        png.Writer(13, 11).write_array(
+                            out, memoryview(arr.astype('uint8')))
+                        self.assertEqual(out.getvalue(),
+                                         expected.getvalue())
+            for value in (-1, 2 ** 16):
+                arr = pixels.astype('int32')
+                arr[3, 5] = value
+                for bitdepth in (8, 16):
+                    w = png.Writer(13, 11, bitdepth=bitdepth)
+                    self.assertRaises(ValueError, w.write_array, BytesIO(),
+                                      arr)
+
         def testPalette(self):
             """Palette as NumPy array"""
             s = ['110010010011',